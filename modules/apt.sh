@@ -1,5 +1,20 @@
 # shellcheck disable=SC2039
 
+# Repository URLs (and all their parent URLs) configured in apt sources, for
+# which indexes have been fetched.
+declare -gA _APT_SOURCES_INDEX=()
+_APT_SOURCES_INDEXED=""
+# When package lists were updated, as "<time> <inputs fingerprint>" by source
+# list file (or "all" for all sources), see apt_update. The "stamp" entry is
+# the modification time of APT_UPDATE_SUCCESS_STAMP after the last update of
+# only some sources, as apt touches it for those too.
+declare -gA _APT_UPDATE_DATA=()
+# Release files added to apt lists by apt_seed_release, until the lists are
+# updated
+_APT_SEEDED_LISTS=()
+# URLs that the last failed apt_update was not authorized to fetch
+_APT_UNAUTHORIZED_URLS=()
+
 private_repo_url() {
     local repo_url="$1"
     local credentials="$2"
@@ -12,7 +27,7 @@ private_repo_url() {
 package_version() {
     local package="$1"
 
-    dpkg-query -W -f '${Version}\n' "$package" 2>/dev/null
+    dpkg_package_version "$package"
 }
 
 apt_add_repo() {
@@ -22,7 +37,7 @@ apt_add_repo() {
     local keyring_file="$4"
 
     _apt_write_list_file "$repo_file" "$repo_url"
-    _apt_add_auth "$repo_url" "$credentials"
+    _apt_add_auth "$repo_file" "$repo_url" "$credentials"
     cp "$keyring_file" "$APT_KEYS_DIR"
 }
 
@@ -32,7 +47,8 @@ apt_remove_repo() {
     local keyring_file="$3"
 
     rm -f "$repo_file" "$keyring_file"
-    _apt_remove_auth "$repo_url"
+    _apt_remove_auth "$repo_file" "$repo_url"
+    _apt_remove_lists "$repo_file" "$repo_url"
 }
 
 apt_add_repo_pinning() {
@@ -47,15 +63,189 @@ Pin-Priority: ${priority}
 EOF
 }
 
+# Run apt-get non-interactively. While another process (like
+# unattended-upgrades) holds the apt or dpkg lock, it's run again after
+# doubling delays, for up to APT_LOCK_TIMEOUT seconds. Messages are not
+# translated, as errors are matched.
 apt_get() {
-    DEBIAN_FRONTEND=noninteractive \
-                   apt-get -y -o Dpkg::Options::='--force-confold' "$@"
+    local errors delay=1 waited=0 result
+    errors=$(mktemp)
+    while true; do
+        result=0
+        # the tool lock is not passed on, as daemons could be started
+        DEBIAN_FRONTEND=noninteractive LC_ALL=C \
+                       apt-get -y -o Dpkg::Options::='--force-confold' "$@" \
+                       2>"$errors" 9>&- || result=$?
+        if [ $result -eq 0 ] || \
+               [ $((waited + delay)) -gt "$APT_LOCK_TIMEOUT" ] || \
+               ! grep -q '^E: Could not get lock' "$errors"; then
+            break
+        fi
+        sleep "$delay"
+        waited=$((waited + delay))
+        delay=$((delay * 2))
+    done
+    cat "$errors" >&2
+    rm -f "$errors"
+    return $result
+}
+
+# Update the package lists only for the given apt source list files (like
+# the ones written by apt_add_repo), keeping the lists of other sources.
+apt_get_update_sources() {
+    local sources_dir
+    sources_dir=$(mktemp -d)
+
+    local file
+    for file in "$@"; do
+        ln -s "$file" "$sources_dir/"
+    done
+    local result=0
+    apt_get update -o Dir::Etc::sourcelist=/dev/null \
+            -o Dir::Etc::sourceparts="$sources_dir" \
+            -o APT::Get::List-Cleanup=0 || result=$?
+    rm -rf "$sources_dir"
+    return $result
+}
+
+# Update the package lists (only for the given source list files, if any),
+# printing the result like check_result. Sources updated less than
+# APT_UPDATE_MAX_AGE seconds ago, whose list files and credentials didn't
+# change since, are not updated again, and "SKIPPED" is printed if all of
+# them are up to date.
+apt_update() {
+    local -a sources=("$@")
+    if [ ${#sources[@]} -eq 0 ]; then
+        sources=(all)
+    fi
+
+    local now
+    printf -v now '%(%s)T' -1
+    _apt_update_load
+
+    local source
+    local -a stale=()
+    for source in "${sources[@]}"; do
+        _apt_update_is_fresh "$source" "$now" || stale+=("$source")
+    done
+    echo -n 'Running apt-get update... '
+    if [ ${#stale[@]} -eq 0 ]; then
+        echo "SKIPPED (package lists are up to date)"
+        _APT_SEEDED_LISTS=()
+        return 0
+    fi
+
+    local -A inputs=()
+    for source in "${stale[@]}"; do
+        inputs[$source]="$(_apt_update_inputs "$source")"
+    done
+    local log result=0
+    log=$(mktemp)
+    retry_transient "$log" _apt_update_is_transient \
+                    _apt_update_fetch "${stale[@]}" || result=$?
+    retry_print_result "$result"
+    if [ $result -ne 0 ] && [ -s "$log" ]; then
+        error_msg "$(<"$log")"
+    fi
+    _APT_UNAUTHORIZED_URLS=()
+    local url error
+    while read -r url error; do
+        if [[ "$error" =~ ^(HttpError)?401 ]]; then
+            _APT_UNAUTHORIZED_URLS+=("$url")
+        fi
+    done < <(_apt_failed_fetches "$log")
+    rm -f "$log"
+    if [ $result -ne 0 ]; then
+        _apt_remove_seeded_lists
+        return $result
+    fi
+    _APT_SEEDED_LISTS=()
+    for source in "${stale[@]}"; do
+        _APT_UPDATE_DATA[$source]="$now ${inputs[$source]}"
+    done
+    if [ "${stale[0]}" != all ]; then
+        _APT_UPDATE_DATA[stamp]=$(
+            stat -c '%Y' "$APT_UPDATE_SUCCESS_STAMP" 2>/dev/null) || true
+    fi
+    _apt_update_save
+}
+
+# Return whether the last failed apt_update was not authorized to fetch a file
+# from a repository.
+apt_update_unauthorized() {
+    local repo_url="$1"
+
+    local url
+    for url in "${_APT_UNAUTHORIZED_URLS[@]}"; do
+        [[ "$url" != "$repo_url"/* ]] || return 0
+    done
+    return 1
+}
+
+# Return whether an error from apt fetching a file (like "HttpError503" or
+# "503  Service Unavailable") is likely transient: a server error, a timeout
+# or a connection failure.
+apt_fetch_error_is_transient() {
+    local error="$1"
+
+    local pattern='^(HttpError)?5[0-9][0-9]([^0-9]|$)|Could not connect|'
+    pattern+='Unable to connect|Connection failed|Connection timed out|'
+    pattern+='Connection reset|Temporary failure resolving|'
+    pattern+='Error reading from server'
+    [[ "$error" =~ $pattern ]]
+}
+
+# Use an InRelease file downloaded for a repository as the fetched one in apt
+# lists, if it's signed with the repository keyring, so that the next update
+# only needs to check it's not modified. Lists already fetched are kept. The
+# file is removed if the update fails, or if the tool exits before updating
+# the lists (like when a later step of an enable fails).
+apt_seed_release() {
+    local repo_url="$1"
+    local file="$2"
+    local keyring_file="$3"
+
+    [ -d "$APT_LISTS_DIR" ] || return 0
+    type -P gpgv >/dev/null || return 0
+    gpgv --keyring "$keyring_file" "$file" >/dev/null 2>&1 || return 0
+
+    local lists_prefix
+    _apt_lists_prefix lists_prefix "${repo_url#*://}/ubuntu/dists/${SERIES}"
+    [ ! -e "${lists_prefix}_InRelease" ] || return 0
+    trap _apt_remove_seeded_lists EXIT
+    # keep the modification time for apt to check if it's modified
+    cp -p "$file" "${lists_prefix}_InRelease"
+    chmod 644 "${lists_prefix}_InRelease"
+    _APT_SEEDED_LISTS+=("${lists_prefix}_InRelease")
+}
+
+# Remove the Release files added by apt_seed_release, if the lists were not
+# updated since, so that the repositories don't look fetched.
+_apt_remove_seeded_lists() {
+    rm -f "${_APT_SEEDED_LISTS[@]}"
+    _APT_SEEDED_LISTS=()
 }
 
 apt_is_package_installed() {
     local package="$1"
 
-    dpkg-query -s "$package" >/dev/null 2>&1
+    dpkg_is_package_installed "$package"
+}
+
+# Return whether the given repository URL is configured in apt sources and
+# its indexes have been fetched.
+apt_is_repo_enabled() {
+    local repo_url="$1"
+
+    if [ ! -d "$APT_LISTS_DIR" ]; then
+        # slow path, let apt build its cache
+        fact_load apt_policy apt-cache policy
+        [[ "$(fact_output apt_policy)" == *"$repo_url"* ]]
+        return
+    fi
+
+    _apt_load_sources_index
+    [ -n "${_APT_SOURCES_INDEX[${repo_url%/}]+set}" ]
 }
 
 # Install a package if the specified file doesn't exist
@@ -69,35 +259,371 @@ apt_install_package_if_missing_file() {
     fi
 }
 
+# Forget indexed apt sources, so that they're read again. This must be called
+# after changing apt sources or lists.
+apt_sources_index_reset() {
+    _APT_SOURCES_INDEX=()
+    _APT_SOURCES_INDEXED=""
+}
+
+# Index repositories from one-line style and deb822 style apt sources. This is
+# only done once per invocation.
+_apt_load_sources_index() {
+    if [ -n "$_APT_SOURCES_INDEXED" ]; then
+        return 0
+    fi
+    _APT_SOURCES_INDEXED="yes"
+
+    local file
+    for file in "$APT_SOURCES_LIST" "$APT_SOURCES_DIR"/*.list; do
+        if [ -f "$file" ]; then
+            _apt_index_list_file "$file"
+        fi
+    done
+    for file in "$APT_SOURCES_DIR"/*.sources; do
+        if [ -f "$file" ]; then
+            _apt_index_sources_file "$file"
+        fi
+    done
+}
+
+_apt_index_list_file() {
+    local file="$1"
+
+    local -a words
+    local i
+    while read -r -a words; do
+        [ "${words[0]}" = "deb" ] || continue
+        i=1
+        # skip options, like "[arch=amd64 signed-by=...]"
+        if [[ "${words[1]}" == \[* ]]; then
+            while [ "$i" -lt "${#words[@]}" ] && [[ "${words[i]}" != *']' ]]; do
+                i=$((i + 1))
+            done
+            i=$((i + 1))
+        fi
+        _apt_index_source "${words[i]}" "${words[i + 1]}"
+    done <"$file"
+}
+
+_apt_index_sources_file() {
+    local file="$1"
+
+    local line key="" value types="" uris="" suites="" enabled="yes"
+    while IFS= read -r line || [ -n "$line" ]; do
+        if [ -z "${line//[[:blank:]]/}" ]; then
+            # end of paragraph
+            _apt_index_sources_paragraph "$types" "$uris" "$suites" "$enabled"
+            types="" uris="" suites="" enabled="yes"
+            continue
+        fi
+        case "$line" in
+            \#*)
+                continue
+                ;;
+            [[:blank:]]*)
+                # continuation of the previous field
+                value="$line"
+                ;;
+            *)
+                key="${line%%:*}"
+                key="${key,,}"
+                value="${line#*:}"
+                ;;
+        esac
+        case "$key" in
+            types) types+=" $value" ;;
+            uris) uris+=" $value" ;;
+            suites) suites+=" $value" ;;
+            enabled) enabled="${value//[[:blank:]]/}" ;;
+        esac
+    done <"$file"
+    _apt_index_sources_paragraph "$types" "$uris" "$suites" "$enabled"
+}
+
+_apt_index_sources_paragraph() {
+    local types="$1"
+    local uris="$2"
+    local suites="$3"
+    local enabled="$4"
+
+    [ "${enabled,,}" != "no" ] && name_in_list deb "$types" || return 0
+    local uri suite
+    for uri in $uris; do
+        for suite in $suites; do
+            _apt_index_source "$uri" "$suite"
+        done
+    done
+}
+
+# Add the source to the index if apt has fetched its Release file.
+_apt_index_source() {
+    local uri="$1"
+    local suite="$2"
+
+    [ -n "$uri" ] && [ -n "$suite" ] || return 0
+    # strip credentials and trailing slashes
+    local scheme="${uri%%://*}"
+    local host_path="${uri#*://}"
+    host_path="${host_path#*@}"
+    host_path="${host_path%/}"
+
+    local dist_path lists_prefix
+    if [[ "$suite" == */ ]]; then
+        dist_path="${host_path}/${suite%/}"
+    else
+        dist_path="${host_path}/dists/${suite}"
+    fi
+    _apt_lists_prefix lists_prefix "$dist_path"
+    if [ ! -f "${lists_prefix}_InRelease" ] && [ ! -f "${lists_prefix}_Release" ]; then
+        return 0
+    fi
+
+    # index the URL and all its parents
+    while true; do
+        _APT_SOURCES_INDEX["${scheme}://${host_path}"]=1
+        [[ "$host_path" == */* ]] || break
+        host_path="${host_path%/*}"
+    done
+}
+
+# Return whether the lists for a source were updated less than
+# APT_UPDATE_MAX_AGE seconds ago, from the same inputs. All sources are also
+# up to date if apt updated them recently (e.g. from unattended-upgrades),
+# after the inputs last changed and after the tool last updated only some
+# sources.
+_apt_update_is_fresh() {
+    local source="$1"
+    local now="$2"
+
+    local record="${_APT_UPDATE_DATA[$source]}"
+    local inputs
+    inputs="$(_apt_update_inputs "$source")"
+    if [ -n "$record" ] && \
+           [ $((now - ${record%% *})) -le "$APT_UPDATE_MAX_AGE" ] && \
+           [ "${record#* }" = "$inputs" ]; then
+        return 0
+    fi
+
+    [ "$source" = all ] || return 1
+    local stamp
+    stamp=$(stat -c '%Y' "$APT_UPDATE_SUCCESS_STAMP" 2>/dev/null) || return 1
+    [ $((now - stamp)) -le "$APT_UPDATE_MAX_AGE" ] || return 1
+    [ "$stamp" -gt "${_APT_UPDATE_DATA[stamp]:-0}" ] || return 1
+    local input
+    for input in ${inputs//,/ }; do
+        [ "${input%%:*}" -lt "$stamp" ] || return 1
+    done
+}
+
+# Print the fingerprint of the inputs of an update for a source list file (or
+# "all" sources): the modification times and sizes of the source files and of
+# the credentials files ("0:0" for missing ones).
+_apt_update_inputs() {
+    local source="$1"
+
+    local -a paths
+    if [ "$source" = all ]; then
+        paths=("$APT_SOURCES_LIST" "$APT_SOURCES_DIR"
+               "$APT_SOURCES_DIR"/*.list "$APT_SOURCES_DIR"/*.sources
+               "$APT_AUTH_DIR" "$APT_AUTH_DIR"/*.conf)
+    else
+        paths=("$source" "$(_apt_auth_part_file "$source")")
+    fi
+    paths+=("$APT_AUTH_FILE")
+
+    local -A stats
+    local path stat
+    while read -r stat path; do
+        stats[$path]="$stat"
+    done < <(stat -L -c '%Y:%s %n' "${paths[@]}" 2>/dev/null)
+
+    local fingerprint=""
+    for path in "${paths[@]}"; do
+        fingerprint+="${fingerprint:+,}${stats[$path]:-0:0}"
+    done
+    echo "$fingerprint"
+}
+
+# Load the package lists update times, if not loaded yet.
+_apt_update_load() {
+    [ ${#_APT_UPDATE_DATA[@]} -eq 0 ] || return 0
+    # shellcheck disable=SC2153
+    [ -r "$UA_APT_UPDATE_DATA" ] || return 0
+
+    local line
+    while IFS= read -r line; do
+        [[ "$line" == *=* ]] || continue
+        _APT_UPDATE_DATA[${line%%=*}]="${line#*=}"
+    done <"$UA_APT_UPDATE_DATA"
+}
+
+# Save the package lists update times, if the file can be written.
+_apt_update_save() {
+    [ -w "${UA_APT_UPDATE_DATA%/*}" ] || return 0
+
+    local tempfile source
+    tempfile=$(mktemp "${UA_APT_UPDATE_DATA}.XXXXXX")
+    for source in "${!_APT_UPDATE_DATA[@]}"; do
+        echo "${source}=${_APT_UPDATE_DATA[$source]}"
+    done >"$tempfile"
+    chmod 644 "$tempfile"
+    mv "$tempfile" "$UA_APT_UPDATE_DATA"
+}
+
+# Write the list file for a repository. The file is not rewritten if it
+# doesn't change, so that its package lists are not updated again.
 _apt_write_list_file() {
     local repo_file="$1"
     local repo_url="$2"
 
-    cat >"$repo_file" <<EOF
-deb ${repo_url}/ubuntu ${SERIES} main
-# deb-src ${repo_url}/ubuntu ${SERIES} main
-EOF
+    local content
+    content="deb ${repo_url}/ubuntu ${SERIES} main
+# deb-src ${repo_url}/ubuntu ${SERIES} main"
+    if [ -f "$repo_file" ] && [ "$(<"$repo_file")" = "$content" ]; then
+        return 0
+    fi
+    echo "$content" >"$repo_file"
 }
 
+# Add credentials for a repository. If apt supports the auth.conf.d directory,
+# they're written to a file for the repository (named after its list file),
+# and moved there from auth.conf if they were added before. Otherwise, they
+# replace the previous entry for the repository in auth.conf.
 _apt_add_auth() {
-    local repo_url="$1"
-    local credentials="$2"
+    local repo_file="$1"
+    local repo_url="$2"
+    local credentials="$3"
 
     local login="${credentials%:*}"
     local password="${credentials#*:}"
+    local repo_host_path="${repo_url/*:\/\//}"
+    local entry="machine ${repo_host_path}/ubuntu/ login ${login} password ${password}"
+
+    if [ -d "$APT_AUTH_DIR" ]; then
+        _apt_remove_auth_entry "$repo_url"
+        _apt_write_auth_part_file "$(_apt_auth_part_file "$repo_file")" \
+                                  "$entry"
+        return
+    fi
+
     [ -f "$APT_AUTH_FILE" ] || touch "$APT_AUTH_FILE"
     chmod 600 "$APT_AUTH_FILE"
-    local repo_host_path="${repo_url/*:\/\//}"
-    echo "machine ${repo_host_path}/ubuntu/ login ${login} password ${password}" \
-         >>"$APT_AUTH_FILE"
+    # don't change the file if the entry is there, see apt_update
+    if ! grep -qxF "$entry" "$APT_AUTH_FILE"; then
+        _apt_remove_auth_entry "$repo_url"
+        echo "$entry" >>"$APT_AUTH_FILE"
+    fi
+}
+
+# Print the path of the auth.conf.d file for a repository list file.
+_apt_auth_part_file() {
+    local repo_file="$1"
+
+    local name="${repo_file##*/}"
+    echo "${APT_AUTH_DIR}/${name%.list}.conf"
+}
+
+# Atomically write the credentials file for a repository, unless it doesn't
+# change.
+_apt_write_auth_part_file() {
+    local auth_file="$1"
+    local entry="$2"
+
+    if [ -f "$auth_file" ] && [ "$(<"$auth_file")" = "$entry" ]; then
+        return 0
+    fi
+    local tempfile
+    tempfile=$(mktemp "${auth_file}.XXXXXX")
+    chmod 600 "$tempfile"
+    echo "$entry" >"$tempfile"
+    mv "$tempfile" "$auth_file"
+}
+
+# Update the package lists for source list files, or all of them if the first
+# one is "all".
+_apt_update_fetch() {
+    if [ "$1" = all ]; then
+        apt_get update
+    else
+        apt_get_update_sources "$@"
+    fi
+}
+
+# Return whether a failed update can be tried again: all the files that
+# failed to download did so with a transient error.
+_apt_update_is_transient() {
+    local output_file="$2"
+
+    local url error transient=""
+    while read -r url error; do
+        apt_fetch_error_is_transient "$error" || return 1
+        transient="yes"
+    done < <(_apt_failed_fetches "$output_file")
+    [ -n "$transient" ]
+}
+
+# Print "<url> <error>" for each file that apt failed to fetch, from its
+# output.
+_apt_failed_fetches() {
+    local output_file="$1"
+
+    local line
+    while read -r line; do
+        [[ "$line" == [EW]:\ Failed\ to\ fetch\ * ]] || continue
+        echo "${line#*: Failed to fetch }"
+    done <"$output_file"
+}
+
+# Set the variable named by the first argument to the path prefix of list
+# files in the apt lists directory for a distribution path (without scheme
+# and credentials, like "esm.ubuntu.com/ubuntu/dists/precise").
+_apt_lists_prefix() {
+    local var="$1"
+    local dist_path="$2"
+
+    # apt quotes some characters in list file names
+    dist_path="${dist_path//_/%5f}"
+    dist_path="${dist_path//\~/%7e}"
+    printf -v "$var" '%s' "${APT_LISTS_DIR}/${dist_path//\//_}"
+}
+
+# Remove the fetched lists of a repository, so that the package lists don't
+# need to be updated after removing it. When the lists were updated is
+# forgotten too, so that they're fetched again if the repository is added back.
+_apt_remove_lists() {
+    local repo_file="$1"
+    local repo_url="$2"
+
+    local lists_prefix
+    _apt_lists_prefix lists_prefix "${repo_url#*://}/ubuntu/dists/${SERIES}"
+    rm -f "${lists_prefix}_"*
+
+    _apt_update_load
+    if [ -n "${_APT_UPDATE_DATA[$repo_file]+set}" ]; then
+        unset '_APT_UPDATE_DATA[$repo_file]'
+        _apt_update_save
+    fi
 }
 
 _apt_remove_auth() {
+    local repo_file="$1"
+    local repo_url="$2"
+
+    rm -f "$(_apt_auth_part_file "$repo_file")"
+    _apt_remove_auth_entry "$repo_url"
+}
+
+# Remove the entry for a repository from auth.conf, if it's there.
+_apt_remove_auth_entry() {
     local repo_url="$1"
 
     local repo_host_path="${repo_url/*:\/\//}"
+    [ -f "$APT_AUTH_FILE" ] || return 0
+    grep -qF "machine ${repo_host_path}/ubuntu/ " "$APT_AUTH_FILE" || return 0
+
     local tempfile
-    tempfile=$(mktemp)
+    tempfile=$(mktemp "${APT_AUTH_FILE}.XXXXXX")
     chmod 600 "$tempfile"
     # don't use pattern matching as the repo path contains slashes and dots
     awk -v repo_host_path="${repo_host_path}/ubuntu/" \
@@ -4,46 +4,285 @@ validate_user_pass_token() {
     echo "$1" | grep -q '^[^:]\+:[^:]\+$'
 }
 
+# Check that a token gives access to a repository, by downloading its
+# InRelease file. If a keyring is given, the file is then used as the fetched
+# one for the repository (see apt_seed_release), so that the following update
+# doesn't download it again. Successful checks are cached for
+# UA_TOKEN_CACHE_TTL seconds.
 check_token() {
     local repo_url="$1"
     local token="$2"
+    local keyring_file="$3"
 
     echo -n 'Checking token... '
 
-    if [ -x "$APT_HELPER" ]; then
-        check_result check_url_with_token "$repo_url" "$token" \
-                     "/dists/${SERIES}/Release"
-    else
+    if [ ! -x "$APT_HELPER" ]; then
         echo 'SKIPPED'
+        return 0
+    fi
+    if token_cache_is_valid "$repo_url" "$token"; then
+        echo 'OK (cached)'
+        return 0
     fi
+
+    local release log error_line result=0
+    release="$(mktemp)"
+    log="$(mktemp)"
+    retry_transient "$log" _token_fetch_is_transient \
+                    _probe_url_with_token "$repo_url" "$token" \
+                    "/dists/${SERIES}/InRelease" "$release" || result=$?
+    error_line=$(<"$log")
+    case "$result" in
+        0)
+            retry_print_result 0
+            token_cache_add "$repo_url" "$token"
+            if [ -n "$keyring_file" ]; then
+                apt_seed_release "$repo_url" "$release" "$keyring_file"
+            fi
+            ;;
+        2)
+            retry_print_result 2
+            token_cache_remove "$repo_url" "$token"
+            error_msg 'Invalid token'
+            ;;
+        75|124)
+            if token_cache_is_valid "$repo_url" "$token" any; then
+                # the token worked before, the repository may be unavailable
+                echo 'OK (cached, stale)'
+                result=0
+            else
+                retry_print_result "$result"
+                error_msg "Failed checking token ($error_line)"
+            fi
+            ;;
+        *)
+            retry_print_result "$result"
+            error_msg "Failed checking token ($error_line)"
+            ;;
+    esac
+    rm -f "$release" "$log"
+    [ "$result" -eq 0 ] || error_exit invalid_token
 }
 
-check_url_with_token() {
+# Return whether a token was successfully checked for a repository less than
+# the specified number of seconds ago (UA_TOKEN_CACHE_TTL by default, "any"
+# for no limit).
+token_cache_is_valid() {
     local repo_url="$1"
     local token="$2"
-    local file="$3"
+    local max_age="${3:-$UA_TOKEN_CACHE_TTL}"
 
-    local url
-    url=$(private_repo_url "$repo_url" "$token" "$file")
+    local file checked now
+    file="${UA_TOKEN_CACHE_DIR}/$(_token_cache_key "$repo_url" "$token")"
+    checked=$(stat -c '%Y' "$file" 2>/dev/null) || return 1
+    [ "$max_age" != "any" ] || return 0
+    printf -v now '%(%s)T' -1
+    [ $((now - checked)) -le "$max_age" ]
+}
 
-    local discard log
-    # apt-helper needs a filename to download to, which is just removed at the
-    # end
-    discard="$(mktemp)"
-    log="$(mktemp)"
-    if "$APT_HELPER" download-file "$url" "$discard" >"$log" 2>&1; then
-        rm -f "$discard" "$log"
-        return 0
+# Record a successful token check for a repository, if the cache can be
+# written. The cache is only readable by root.
+token_cache_add() {
+    local repo_url="$1"
+    local token="$2"
+
+    [ -d "$UA_TOKEN_CACHE_DIR" ] || \
+        mkdir -m 700 "$UA_TOKEN_CACHE_DIR" 2>/dev/null || return 0
+    local file
+    file="${UA_TOKEN_CACHE_DIR}/$(_token_cache_key "$repo_url" "$token")"
+    (umask 077 && touch "$file" 2>/dev/null) || true
+}
+
+# Forget a token check for a repository.
+token_cache_remove() {
+    local repo_url="$1"
+    local token="$2"
+
+    rm -f "${UA_TOKEN_CACHE_DIR}/$(_token_cache_key "$repo_url" "$token")"
+}
+
+# Print the cache key for a token and repository. Tokens are not stored, only
+# a hash.
+_token_cache_key() {
+    local repo_url="$1"
+    local token="$2"
+
+    local hash
+    hash=$(printf '%s %s' "$repo_url" "$token" | sha256sum)
+    echo "${hash%% *}"
+}
+
+# Check tokens for the repositories of several services, given as
+# "<service>=<token>" arguments. At most "--jobs" checks (4 by default) run
+# concurrently. The result for each service is printed in "key=value" format:
+#  - <service>.result: "ok", "invalid-token", "error" or "skipped" (if
+#    apt-helper is not available)
+#  - <service>.error: the error message, if the check failed
+#  - <service>.time_ms: how long the check took, in milliseconds
+# Return 3 (invalid token) if any check failed.
+check_tokens() {
+    local jobs=4
+    local -a args=()
+    while [ $# -gt 0 ]; do
+        case "$1" in
+            --jobs)
+                jobs="$2"
+                shift
+                ;;
+            -*)
+                error_msg "Unknown option \"$1\""
+                usage
+                ;;
+            *)
+                args+=("$1")
+                ;;
+        esac
+        # "--jobs" may be missing its value
+        shift || true
+    done
+    if ! [[ "$jobs" =~ ^[1-9][0-9]*$ ]]; then
+        error_msg "Invalid number of jobs \"$jobs\""
+        usage
+    fi
+
+    local -A tokens=()
+    local services="" arg service
+    for arg in "${args[@]}"; do
+        service="${arg%%=*}"
+        if [ -z "${SERVICE_REGISTRY[${service//-/_}.repo_url]}" ]; then
+            error_msg "Invalid service with a repository token: \"$service\""
+            usage
+        fi
+        tokens[$service]=""
+        if [ "$arg" != "${arg#*=}" ]; then
+            tokens[$service]="${arg#*=}"
+        fi
+        name_in_list "$service" "$services" || services+=" $service"
+    done
+    if [ -z "$services" ]; then
+        error_msg "No service token to check"
+        usage
     fi
 
-    local error_line
-    error_line=$(sed -n 's/^E: Failed to fetch [^ ]\+ \+//p' "$log")
-    if echo "$error_line" | grep -q '^\(HttpError\)\?401'; then
-        error_msg 'Invalid token'
+    local outdir
+    local -a pids=()
+    outdir=$(mktemp -d)
+    for service in $services; do
+        # bash 4.2 has no "wait -n", wait for the oldest check instead
+        if [ ${#pids[@]} -ge "$jobs" ]; then
+            wait "${pids[0]}" || true
+            pids=("${pids[@]:1}")
+        fi
+        _check_service_token "$service" "${tokens[$service]}" \
+                             >"$outdir/$service" &
+        pids+=($!)
+    done
+    wait || true
+
+    local failed=0
+    for service in $services; do
+        sed "s/^/${service}./" "$outdir/$service"
+        grep -qxE 'result=(invalid-token|error)' "$outdir/$service" && \
+            failed=1
+    done
+    rm -rf "$outdir"
+    if [ "$failed" -eq 1 ]; then
+        error_exit invalid_token
+    fi
+}
+
+# Check the token for the repository of a service, printing the result as
+# described in check_tokens (without the service prefix).
+_check_service_token() {
+    local service="$1"
+    local token="$2"
+
+    local repo_url="${SERVICE_REGISTRY[${service//-/_}.repo_url]}"
+    local start end log error_line attempts=0 result=0
+    start=$(date +%s%3N)
+    if ! validate_user_pass_token "$token"; then
+        result=2
+        error_line='the token must be in the form "user:password"'
+    elif [ ! -x "$APT_HELPER" ]; then
+        result=-1
     else
-        error_msg "Failed checking token ($error_line)"
+        log="$(mktemp)"
+        retry_transient "$log" _token_fetch_is_transient \
+                        _probe_url_with_token "$repo_url" "$token" \
+                        "/dists/${SERIES}/InRelease" || result=$?
+        error_line=$(<"$log")
+        attempts="$RETRY_ATTEMPTS"
+        rm -f "$log"
     fi
+    end=$(date +%s%3N)
+
+    case "$result" in
+        0)
+            token_cache_add "$repo_url" "$token"
+            echo "result=ok"
+            ;;
+        -1)
+            echo "result=skipped"
+            ;;
+        2)
+            token_cache_remove "$repo_url" "$token"
+            echo "result=invalid-token"
+            echo "error=${error_line:-Invalid token}"
+            ;;
+        *)
+            echo "result=error"
+            echo "error=${error_line}"
+            ;;
+    esac
+    echo "attempts=${attempts}"
+    echo "time_ms=$((end - start))"
+}
+
+# Return whether a token check can be tried again, see _probe_url_with_token.
+_token_fetch_is_transient() {
+    local result="$1"
 
-    rm -f "$discard" "$log"
-    error_exit invalid_token
+    [ "$result" -eq 75 ] || [ "$result" -eq 124 ]
+}
+
+# Download a file from a repository using a token, to the output file if
+# given. On failure, print the apt-helper error and return 2 if the token is
+# not authorized, 124 if the download timed out (see run_with_timeout), 75 for
+# other transient errors (see apt_fetch_error_is_transient), 1 otherwise.
+_probe_url_with_token() {
+    local repo_url="$1"
+    local token="$2"
+    local file="$3"
+    local output="$4"
+
+    local url
+    url=$(private_repo_url "$repo_url" "$token" "$file")
+
+    local discard="" log
+    if [ -z "$output" ]; then
+        # apt-helper needs a filename to download to, which is just removed
+        # at the end
+        discard="$(mktemp)"
+        output="$discard"
+    fi
+    log="$(mktemp)"
+    local result=0
+    run_with_timeout "$APT_HELPER" download-file "$url" "$output" \
+                     >"$log" 2>&1 || result=$?
+    if [ "$result" -eq 124 ]; then
+        echo "timed out after ${UA_PROBE_TIMEOUT} seconds"
+    elif [ "$result" -ne 0 ]; then
+        local error_line
+        error_line=$(sed -n 's/^E: Failed to fetch [^ ]\+ \+//p' "$log")
+        echo "$error_line"
+        if [[ "$error_line" =~ ^(HttpError)?401 ]]; then
+            result=2
+        elif apt_fetch_error_is_transient "$error_line"; then
+            result=75
+        else
+            result=1
+        fi
+    fi
+    rm -f ${discard:+"$discard"} "$log"
+    return $result
 }
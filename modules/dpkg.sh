@@ -0,0 +1,70 @@
+# shellcheck disable=SC2039
+
+# Status and version of packages known to dpkg, read from the dpkg status
+# file once per invocation.
+declare -gA _DPKG_STATUS=()
+declare -gA _DPKG_VERSION=()
+_DPKG_STATUS_LOADED=""
+
+# Return whether a package is installed (possibly not fully configured).
+dpkg_is_package_installed() {
+    local package="$1"
+
+    _dpkg_load_status
+    case "${_DPKG_STATUS[$package]:-not-installed}" in
+        not-installed|config-files)
+            return 1
+            ;;
+    esac
+}
+
+# Print the version of a package known to dpkg.
+dpkg_package_version() {
+    local package="$1"
+
+    _dpkg_load_status
+    if [ -n "${_DPKG_VERSION[$package]}" ]; then
+        echo "${_DPKG_VERSION[$package]}"
+    fi
+}
+
+# Forget the package status, so that it's read again. This must be called
+# after installing or removing packages.
+dpkg_status_reset() {
+    _DPKG_STATUS=()
+    _DPKG_VERSION=()
+    _DPKG_STATUS_LOADED=""
+}
+
+_dpkg_load_status() {
+    if [ -n "$_DPKG_STATUS_LOADED" ]; then
+        return 0
+    fi
+    _DPKG_STATUS_LOADED="yes"
+    [ -r "$DPKG_STATUS_FILE" ] || return 0
+
+    local package status version
+    while read -r package status version; do
+        # for multi-arch packages, prefer the status of an installed one
+        if [ "${_DPKG_STATUS[$package]}" = "installed" ]; then
+            continue
+        fi
+        _DPKG_STATUS[$package]="$status"
+        _DPKG_VERSION[$package]="$version"
+    done < <(_dpkg_read_status_file)
+}
+
+# Print the name, status and version of each package in the status file.
+_dpkg_read_status_file() {
+    awk '
+        function flush() {
+            if (package != "") print package, status, version
+            package = status = version = ""
+        }
+        /^Package:/ { package = $2 }
+        /^Status:/ { status = $NF }
+        /^Version:/ { version = $2 }
+        /^$/ { flush() }
+        END { flush() }
+    ' "$DPKG_STATUS_FILE"
+}
@@ -0,0 +1,62 @@
+# shellcheck disable=SC2039
+
+# System facts (e.g. the output of "canonical-livepatch status") are probed at
+# most once per invocation and shared by all the services that need them.
+declare -gA _FACTS_OUTPUT=()
+declare -gA _FACTS_RESULT=()
+# Set to "yes" when loading a fact whose probe timed out. Callers reset it
+# before checking a service, to know if the result can be trusted.
+FACTS_TIMED_OUT=""
+
+# Run the probe command for a fact, unless it already ran, and store its
+# output and exit status. Probes are stopped after UA_PROBE_TIMEOUT seconds,
+# with 124 as exit status.
+#
+# Facts must be loaded in the main shell (not in a subshell) for the result to
+# be reused.
+fact_load() {
+    local name="$1"
+    shift
+
+    if [ -z "${_FACTS_RESULT[$name]+set}" ]; then
+        local result=0
+        _FACTS_OUTPUT[$name]=$(run_with_timeout "$@" 2>&1) || result=$?
+        _FACTS_RESULT[$name]=$result
+    fi
+    if [ "${_FACTS_RESULT[$name]}" -eq 124 ]; then
+        FACTS_TIMED_OUT="yes"
+    fi
+}
+
+# Print the output of a loaded fact, if any.
+fact_output() {
+    local name="$1"
+
+    if [ -n "${_FACTS_OUTPUT[$name]}" ]; then
+        echo "${_FACTS_OUTPUT[$name]}"
+    fi
+}
+
+# Return the exit status of the probe for a loaded fact.
+fact_result() {
+    local name="$1"
+
+    return "${_FACTS_RESULT[$name]:-1}"
+}
+
+# Forget the specified facts (or all of them if none is given), so that they
+# are probed again. This must be called after changing the system state.
+facts_reset() {
+    if [ $# -eq 0 ]; then
+        _FACTS_OUTPUT=()
+        _FACTS_RESULT=()
+        # shellcheck disable=SC2034
+        FACTS_TIMED_OUT=""
+        return
+    fi
+
+    local name
+    for name in "$@"; do
+        unset "_FACTS_OUTPUT[$name]" "_FACTS_RESULT[$name]"
+    done
+}
@@ -0,0 +1,85 @@
+# shellcheck disable=SC2034,SC2039
+
+# Services managed by the script (in alphabetical order)
+SERVICES="cc-provisioning cisaudit esm fips livepatch"
+
+# Settings of services, by "<service>.<setting>" key, where the service name
+# uses underscores (e.g. "cc_provisioning"):
+#  - module: the module file with the service functions, see service_load
+#  - title: the name shown in messages
+#  - series, archs: where the service is supported ("ALL" for any arch)
+#  - status_inputs: status cache inputs the service status depends on
+#  - repo_url, repo_key_file, repo_list: the service APT repository, see
+#    service_add_repo
+#  - repo_title, install_title: the names of the APT repository and of the
+#    installed packages shown when enabling the service, see service_enable
+#
+# Entries without a module (like "fips_updates") only hold settings, and are
+# not services.
+#
+# Commands other than enable-, disable- and is-<service>-enabled are
+# registered with a "command.<command>" key, set to the service and the
+# function implementing the command.
+declare -gA SERVICE_REGISTRY=(
+    [cc_provisioning.module]="service-cc.sh"
+    [cc_provisioning.title]="Canonical Common Criteria EAL2 Provisioning"
+    [cc_provisioning.series]="xenial"
+    [cc_provisioning.archs]="x86_64 ppc64le s390x"
+    [cc_provisioning.status_inputs]="dpkg"
+    [cc_provisioning.repo_url]="https://private-ppa.launchpad.net/ubuntu-advantage/commoncriteria"
+    [cc_provisioning.repo_key_file]="ubuntu-cc-keyring.gpg"
+    [cc_provisioning.repo_list]=${CC_PROVISIONING_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-cc-${SERIES}.list"}
+    [cc_provisioning.repo_title]="Ubuntu Common Criteria PPA repository"
+    [cc_provisioning.install_title]="Common Criteria artifacts"
+
+    [cisaudit.module]="service-cis.sh"
+    [cisaudit.title]="Canonical CIS Benchmark 16.04 Audit Tool"
+    [cisaudit.series]="xenial"
+    [cisaudit.archs]="x86_64 ppc64le s390x"
+    [cisaudit.status_inputs]="dpkg"
+    [cisaudit.repo_url]="https://private-ppa.launchpad.net/ubuntu-advantage/security-benchmarks"
+    [cisaudit.repo_key_file]="ubuntu-securitybenchmarks-keyring.gpg"
+    [cisaudit.repo_list]=${CISAUDIT_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-cis-${SERIES}.list"}
+    [cisaudit.repo_title]="Ubuntu Security Benchmarks PPA repository"
+    [cisaudit.install_title]="CIS audit benchmark tool"
+
+    [esm.module]="service-esm.sh"
+    [esm.title]="Extended Security Maintenance"
+    [esm.series]="precise"
+    [esm.archs]="ALL"
+    [esm.status_inputs]="apt-sources apt-lists esm-repo"
+    [esm.repo_url]="https://esm.ubuntu.com"
+    [esm.repo_key_file]="ubuntu-esm-keyring.gpg"
+    [esm.repo_list]=${ESM_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-esm-${SERIES}.list"}
+    [esm.repo_title]="Ubuntu ESM repository"
+
+    [fips.module]="service-fips.sh"
+    [fips.title]="Canonical FIPS 140-2 Modules"
+    [fips.series]="xenial"
+    [fips.archs]="x86_64 ppc64le s390x"
+    [fips.status_inputs]="dpkg apt-sources apt-lists fips-repos fips-kernel"
+    [fips.repo_url]="https://private-ppa.launchpad.net/ubuntu-advantage/fips"
+    [fips.repo_key_file]="ubuntu-fips-keyring.gpg"
+    [fips.repo_list]=${FIPS_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-fips-${SERIES}.list"}
+    [fips.repo_title]="Ubuntu FIPS PPA repository"
+    [fips.install_title]="FIPS packages"
+    [command.enable-fips-updates]="fips fips_updates_command"
+    # the non-certified updates repository, enabled by enable-fips-updates
+    [fips_updates.repo_url]="https://private-ppa.launchpad.net/ubuntu-advantage/fips-updates"
+    [fips_updates.repo_key_file]="ubuntu-fips-updates-keyring.gpg"
+    [fips_updates.repo_list]=${FIPS_UPDATES_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-fips-updates-${SERIES}.list"}
+
+    [livepatch.module]="service-livepatch.sh"
+    [livepatch.title]="Canonical Livepatch"
+    [livepatch.series]="trusty xenial bionic"
+    [livepatch.archs]="x86_64"
+    [livepatch.status_inputs]="livepatch"
+)
+
+# Return whether a service (with either hyphens or underscores in the name)
+# is registered.
+service_is_registered() {
+    local service="${1//-/_}"
+
+    [ -n "${SERVICE_REGISTRY[$service.module]}" ]
+}
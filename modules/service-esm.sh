@@ -1,32 +1,23 @@
 # shellcheck disable=SC2034,SC2039
 
-ESM_SERVICE_TITLE="Extended Security Maintenance"
-ESM_SUPPORTED_SERIES="precise"
-ESM_SUPPORTED_ARCHS="ALL"
+# changing a file in sources.list.d doesn't change the directory mtime
+STATUS_CACHE_INPUTS["esm-repo"]="${SERVICE_REGISTRY[esm.repo_list]}"
 
-ESM_REPO_URL="https://esm.ubuntu.com"
-ESM_REPO_KEY_FILE="ubuntu-esm-keyring.gpg"
-ESM_REPO_LIST=${ESM_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-esm-${SERIES}.list"}
+esm_enable_check() {
+    local token="$1"
+
+    service_check_token esm "$token"
+}
 
-esm_enable() {
+esm_enable_repo() {
     local token="$1"
 
-    check_token "$ESM_REPO_URL" "$token"
-    apt_add_repo "$ESM_REPO_LIST" "$ESM_REPO_URL" "$token" \
-                 "${KEYRINGS_DIR}/${ESM_REPO_KEY_FILE}"
-    apt_install_package_if_missing_file "$APT_METHOD_HTTPS" apt-transport-https
-    apt_install_package_if_missing_file "$CA_CERTIFICATES" ca-certificates
-    echo -n 'Running apt-get update... '
-    check_result apt_get update
-    echo 'Ubuntu ESM repository enabled.'
+    service_add_repo esm "$token"
 }
 
 esm_disable() {
-    if [ -f "$ESM_REPO_LIST" ]; then
-        apt_remove_repo "$ESM_REPO_LIST" "$ESM_REPO_URL" \
-                        "$APT_KEYS_DIR/$ESM_REPO_KEY_FILE"
-        echo -n 'Running apt-get update... '
-        check_result apt_get update
+    if [ -f "${SERVICE_REGISTRY[esm.repo_list]}" ]; then
+        service_remove_repo esm
         echo 'Ubuntu ESM repository disabled.'
     else
         echo 'Ubuntu ESM repository was not enabled.'
@@ -34,7 +25,7 @@ esm_disable() {
 }
 
 esm_is_enabled() {
-    apt-cache policy | grep -Fq "$ESM_REPO_URL"
+    apt_is_repo_enabled "${SERVICE_REGISTRY[esm.repo_url]}"
 }
 
 esm_validate_token() {
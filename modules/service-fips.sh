@@ -1,16 +1,6 @@
 # shellcheck disable=SC2034,SC2039
 
-FIPS_SERVICE_TITLE="Canonical FIPS 140-2 Modules"
-FIPS_SUPPORTED_SERIES="xenial"
-FIPS_SUPPORTED_ARCHS="x86_64 ppc64le s390x"
-
-FIPS_REPO_URL="https://private-ppa.launchpad.net/ubuntu-advantage/fips"
-FIPS_REPO_KEY_FILE="ubuntu-fips-keyring.gpg"
-FIPS_REPO_LIST=${FIPS_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-fips-${SERIES}.list"}
 FIPS_REPO_PREFERENCES=${FIPS_REPO_PREFERENCES:-"/etc/apt/preferences.d/ubuntu-fips-${SERIES}"}
-FIPS_UPDATES_REPO_URL="https://private-ppa.launchpad.net/ubuntu-advantage/fips-updates"
-FIPS_UPDATES_REPO_KEY_FILE="ubuntu-fips-updates-keyring.gpg"
-FIPS_UPDATES_REPO_LIST=${FIPS_UPDATES_REPO_LIST:-"/etc/apt/sources.list.d/ubuntu-fips-updates-${SERIES}.list"}
 FIPS_UPDATES_REPO_PREFERENCES=${FIPS_UPDATES_REPO_PREFERENCES:-"/etc/apt/preferences.d/ubuntu-fips-updates-${SERIES}"}
 FIPS_ENABLED_FILE=${FIPS_ENABLED_FILE:-"/proc/sys/crypto/fips_enabled"}
 if [ "$ARCH" = "s390x" ]; then
@@ -19,6 +9,10 @@ else
     FIPS_BOOT_CFG_DIR=${FIPS_BOOT_CFG_DIR:-"/etc/default/grub.d"}
     FIPS_BOOT_CFG=${FIPS_BOOT_CFG:-"${FIPS_BOOT_CFG_DIR}/99-fips.cfg"}
 fi
+# changing a file in sources.list.d doesn't change the directory mtime
+STATUS_CACHE_INPUTS["fips-repos"]="${SERVICE_REGISTRY[fips.repo_list]} "
+STATUS_CACHE_INPUTS["fips-repos"]+="${SERVICE_REGISTRY[fips_updates.repo_list]}"
+STATUS_CACHE_INPUTS["fips-kernel"]="$FIPS_ENABLED_FILE"
 FIPS_HMAC_PACKAGES="openssh-client-hmac openssh-server-hmac libssl1.0.0-hmac \
     linux-fips strongswan-hmac"
 FIPS_OTHER_PACKAGES="openssh-client openssh-server openssl libssl1.0.0 \
@@ -28,27 +22,27 @@ FIPS_SSH_SERVER_PACKAGES="openssh-server openssh-server-hmac"
 FIPS_SSH_CLIENT_PACKAGES="openssh-client openssh-client-hmac"
 FIPS_STRONGSWAN_PACKAGES="strongswan strongswan-hmac"
 
-fips_enable() {
+fips_enable_check() {
     local token="$1"
 
     _fips_check_installed || error_exit service_already_enabled
+    service_check_token fips "$token"
+}
+
+fips_enable_repo() {
+    local token="$1"
 
-    check_token "$FIPS_REPO_URL" "$token"
-    apt_add_repo "$FIPS_REPO_LIST" "$FIPS_REPO_URL" "$token" \
-                 "${KEYRINGS_DIR}/${FIPS_REPO_KEY_FILE}"
+    service_add_repo fips "$token"
     apt_add_repo_pinning "$FIPS_REPO_PREFERENCES" \
                          LP-PPA-ubuntu-advantage-fips 1001
-    apt_install_package_if_missing_file "$APT_METHOD_HTTPS" apt-transport-https
-    apt_install_package_if_missing_file "$CA_CERTIFICATES" ca-certificates
-    echo -n 'Running apt-get update... '
-    check_result apt_get update
-    echo 'Ubuntu FIPS PPA repository enabled.'
-
-    # install all the fips packages
-    echo -n 'Installing FIPS packages (this may take a while)... '
+}
+
+fips_enable_packages() {
     # shellcheck disable=SC2086
-    check_result apt_get install $FIPS_HMAC_PACKAGES $FIPS_OTHER_PACKAGES
+    echo $FIPS_HMAC_PACKAGES $FIPS_OTHER_PACKAGES
+}
 
+fips_enable_configure() {
     echo "Configuring FIPS... "
     _fips_configure
     echo "Successfully configured FIPS. Please reboot into the FIPS kernel to enable it."
@@ -58,6 +52,25 @@ fips_disable() {
     not_supported 'Disabling FIPS'
 }
 
+# The enable-fips-updates command. There is no separate fips-updates
+# service.
+fips_updates_command() {
+    local token="$1"
+    local bypass_prompt=0
+    if [ -n "$2" ]; then
+        if [ "$2" = "-y" ]; then
+            bypass_prompt=1
+        else
+            error_msg "Unknown option \"$2\""
+            usage
+        fi
+    fi
+    service_check_user
+    service_check_support "fips"
+    fips_validate_token "$token" || error_exit invalid_token
+    fips_updates_enable "$token" "$bypass_prompt"
+}
+
 fips_updates_enable() {
     local token="$1"
     local bypass_prompt="$2"
@@ -72,7 +85,7 @@ fips_updates_enable() {
         error_exit service_already_enabled
     fi
 
-    check_token "$FIPS_UPDATES_REPO_URL" "$token"
+    service_check_token fips_updates "$token"
 
     echo "Installing updates from FIPS-UPDATES repository will take the system out of FIPS compliance."
     if [ "$bypass_prompt" -ne 1 ]; then
@@ -83,15 +96,13 @@ fips_updates_enable() {
     fi
 
     # add the fips-updates repo if the system is undergoing updates the first time
-    if [ ! -f "$FIPS_UPDATES_REPO_LIST" ]; then
-        apt_add_repo "$FIPS_UPDATES_REPO_LIST" "$FIPS_UPDATES_REPO_URL" "$token" \
-                 "${KEYRINGS_DIR}/${FIPS_UPDATES_REPO_KEY_FILE}"
+    if [ ! -f "${SERVICE_REGISTRY[fips_updates.repo_list]}" ]; then
+        service_add_repo fips_updates "$token"
         apt_add_repo_pinning "$FIPS_UPDATES_REPO_PREFERENCES" \
                          LP-PPA-ubuntu-advantage-fips-updates 1001
         apt_install_package_if_missing_file "$APT_METHOD_HTTPS" apt-transport-https
         apt_install_package_if_missing_file "$CA_CERTIFICATES" ca-certificates
-        echo -n 'Running apt-get update... '
-        check_result apt_get update
+        service_update_repos "fips_updates=$token"
         echo 'Ubuntu FIPS-UPDATES PPA repository enabled.'
     fi
 
@@ -103,36 +114,17 @@ fips_updates_enable() {
        fips_kernel_version=$(package_version linux-fips)
     fi
 
-    # update all the installed fips packages
+    # update all the installed fips packages in a single transaction
+    _fips_updates_plan
     echo -n 'Updating FIPS packages (this may take a while)... '
     # shellcheck disable=SC2086
-    # update fips kernel and initramfs
-    check_result apt_get install "linux-fips"
-    check_result apt_get install "fips-initramfs"
-    # update openssl if it is installed
-    if apt_is_package_installed "libssl1.0.0"; then
-        # shellcheck disable=SC2086
-        check_result apt_get install $FIPS_SSL_PACKAGES
-        echo "FIPS OpenSSL packages updated."
-    fi
-    # update openssh-server if it is installed
-    if apt_is_package_installed "openssh-server"; then
-        # shellcheck disable=SC2086
-        check_result apt_get install $FIPS_SSH_SERVER_PACKAGES
-        echo "FIPS OpenSSH-server packages updated."
-    fi
-    # update openssh-client if it is installed
-    if apt_is_package_installed "openssh-client"; then
-        # shellcheck disable=SC2086
-        check_result apt_get install $FIPS_SSH_CLIENT_PACKAGES
-        echo "FIPS OpenSSH-client packages updated."
-    fi
-    # update strongswan if it is installed
-    if apt_is_package_installed "strongswan"; then
-        # shellcheck disable=SC2086
-        check_result apt_get install $FIPS_STRONGSWAN_PACKAGES
-        echo "FIPS Strongswan packages updated."
-    fi
+    check_result apt_get install $_FIPS_UPDATES_PACKAGES
+    local message
+    for message in "${_FIPS_UPDATES_MESSAGES[@]}"; do
+        echo "$message"
+    done
+    # packages have changed, don't use the status read before the update
+    dpkg_status_reset
     # if fips was never configured before and is enabled for the
     # first time, configure fips
     if [ "$fips_configured" -eq 0 ]; then
@@ -148,6 +140,35 @@ fips_updates_enable() {
     fi
 }
 
+# Plan the update of FIPS packages, setting _FIPS_UPDATES_PACKAGES to the
+# packages to install and _FIPS_UPDATES_MESSAGES to the messages for the
+# updated groups of packages. The FIPS kernel and initramfs are always
+# updated, other groups only if they're installed.
+_fips_updates_plan() {
+    _FIPS_UPDATES_PACKAGES="linux-fips fips-initramfs"
+    _FIPS_UPDATES_MESSAGES=()
+    _fips_updates_plan_group libssl1.0.0 "$FIPS_SSL_PACKAGES" \
+                             "FIPS OpenSSL packages updated."
+    _fips_updates_plan_group openssh-server "$FIPS_SSH_SERVER_PACKAGES" \
+                             "FIPS OpenSSH-server packages updated."
+    _fips_updates_plan_group openssh-client "$FIPS_SSH_CLIENT_PACKAGES" \
+                             "FIPS OpenSSH-client packages updated."
+    _fips_updates_plan_group strongswan "$FIPS_STRONGSWAN_PACKAGES" \
+                             "FIPS Strongswan packages updated."
+}
+
+# Add a group of packages to the FIPS updates plan if a package is installed.
+_fips_updates_plan_group() {
+    local installed_package="$1"
+    local packages="$2"
+    local message="$3"
+
+    if apt_is_package_installed "$installed_package"; then
+        _FIPS_UPDATES_PACKAGES+=" $packages"
+        _FIPS_UPDATES_MESSAGES+=("$message")
+    fi
+}
+
 fips_is_enabled() {
     apt_is_package_installed fips-initramfs && [ "$(_fips_enabled_check)" -eq 1 ]
 }
@@ -193,7 +214,7 @@ fips_print_status() {
 }
 
 _fips_updates_is_enabled() {
-    apt-cache policy | grep -Fq "$FIPS_UPDATES_REPO_URL"
+    apt_is_repo_enabled "${SERVICE_REGISTRY[fips_updates.repo_url]}"
 }
 
 _fips_configure() {
@@ -1,17 +1,17 @@
 # shellcheck disable=SC2034,SC2039
 
-LIVEPATCH_SERVICE_TITLE="Canonical Livepatch"
-LIVEPATCH_SUPPORTED_SERIES="trusty xenial bionic"
-LIVEPATCH_SUPPORTED_ARCHS="x86_64"
 LIVEPATCH_FALLBACK_KERNEL="linux-image-generic"
+# the installed snap revision, and the daemon state
+LIVEPATCH_SNAP_DIR=${LIVEPATCH_SNAP_DIR:-"/snap/canonical-livepatch/current"}
+LIVEPATCH_STATE_DIR=${LIVEPATCH_STATE_DIR:-"/var/snap/canonical-livepatch/common"}
+STATUS_CACHE_INPUTS["livepatch"]="$LIVEPATCH_SNAP_DIR $LIVEPATCH_STATE_DIR"
 
 _livepatch_install_supported_kernel() {
     if apt_is_package_installed "${LIVEPATCH_FALLBACK_KERNEL}"; then
         return 0
     fi
     echo 'A Livepatch compatible kernel will be installed.'
-    echo -n 'Running apt-get update... '
-    check_result apt_get update
+    apt_update
     echo -n "Installing ${LIVEPATCH_FALLBACK_KERNEL}... "
     check_result apt_get install "${LIVEPATCH_FALLBACK_KERNEL}"
 }
@@ -122,18 +122,19 @@ livepatch_disable() {
 }
 
 livepatch_is_enabled() {
+    _livepatch_load_status
     # Explicitly return 1 for the case where the command is not found.
-    canonical-livepatch status >/dev/null 2>&1 || return 1
+    fact_result livepatch_status || return 1
 }
 
 livepatch_disabled_reason() {
     local output
-    local result=0
     local unsupported_kernel_msg="is not eligible for livepatch updates"
     local message_to_check="$1"
 
     if [ -z "${message_to_check}" ]; then
-        output=$(canonical-livepatch status 2>&1) || result=$?
+        _livepatch_load_status
+        output=$(fact_output livepatch_status)
     else
         output="${message_to_check}"
     fi
@@ -143,8 +144,9 @@ livepatch_disabled_reason() {
 }
 
 livepatch_print_status() {
+    _livepatch_load_status
     # remove empty lines
-    canonical-livepatch status | grep -vE '^[[:blank:]]*$'
+    fact_output livepatch_status | grep -vE '^[[:blank:]]*$'
 }
 
 livepatch_validate_token() {
@@ -171,5 +173,10 @@ _livepatch_install_prereqs() {
         echo 'This may take a few minutes depending on your bandwidth.'
         # show output as it has a nice progress bar and isn't too verbose
         snap install canonical-livepatch
+        facts_reset livepatch_status
     fi
 }
+
+_livepatch_load_status() {
+    fact_load livepatch_status canonical-livepatch status
+}
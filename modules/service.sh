@@ -1,13 +1,51 @@
-# shellcheck disable=SC2039
+# shellcheck disable=SC2039,SC1090
 
+# Services whose module is loaded.
+declare -gA _SERVICE_LOADED=()
+
+# Source the module for a service (see SERVICE_REGISTRY), unless it's already
+# loaded. Service modules are only sourced when the service is used, so this
+# must be called before using the service functions.
+service_load() {
+    local service="${1//-/_}"
+
+    if [ -n "${_SERVICE_LOADED[$service]}" ]; then
+        return 0
+    fi
+    _SERVICE_LOADED[$service]="yes"
+    . "${MODULES_DIR}/${SERVICE_REGISTRY[$service.module]}"
+}
+
+# Run a service command registered in SERVICE_REGISTRY, and refresh the
+# status cache for the service.
+service_run_command() {
+    local command="$1"
+    shift
+
+    local entry="${SERVICE_REGISTRY[command.$command]}"
+    local service="${entry%% *}"
+    local function="${entry#* }"
+    service_load "$service"
+    "$function" "$@"
+    status_cache_refresh "$service"
+}
+
+# Set COMMAND_SERVICE to the name of the service in a service command (e.g.
+# "esm" for "enable-esm"), or to an empty string for other commands.
+# shellcheck disable=SC2034
 service_from_command() {
     local command="$1"
 
-     echo "$command" | sed -n -r \
-         's,^is-(.+)-enabled$,\1,p;
-          s,^(enable|disable)-(.+)$,\2,p'
+    COMMAND_SERVICE=""
+    if [[ "$command" =~ ^is-(.+)-enabled$ ]]; then
+        COMMAND_SERVICE="${BASH_REMATCH[1]}"
+    elif [[ "$command" =~ ^(enable|disable)-(.+)$ ]]; then
+        COMMAND_SERVICE="${BASH_REMATCH[2]}"
+    fi
 }
 
+# Enable a service. Services with an APT repository define the phases
+# described in _service_enable_phases, others a <service>_enable function.
 service_enable() {
     local service="$1"
     local token="$2"
@@ -18,48 +56,149 @@ service_enable() {
     fi
     local opts="$*"
 
+    service_load "$service"
     service_check_user
-    service_check_support "$service"
-    _service_check_enabled "$service" || error_exit service_already_enabled
-    "${service}_validate_token" "$token" || error_exit invalid_token
-    "${service}_enable" "$token" "$opts"
+    _service_check_can_enable "$service" "$token"
+    if type -t "${service}_enable_repo" >/dev/null; then
+        _service_enable_phases "$service=$token"
+    else
+        "${service}_enable" "$token" "$opts"
+    fi
+    status_cache_refresh "$service"
+}
+
+# Enable several services, given as "<service>=<token>" arguments. All
+# services are checked before enabling any of them, and the APT repositories
+# are set up together, with a single package lists update and install.
+service_enable_multiple() {
+    local -A tokens=()
+    local services="" arg service
+    local -a phased=()
+    for arg in "$@"; do
+        service="${arg%%=*}"
+        if ! service_is_registered "$service"; then
+            error_msg "Invalid service: \"$service\""
+            usage
+        fi
+        service="${service//-/_}"
+        name_in_list "$service" "$services" && continue
+        tokens[$service]=""
+        if [ "$arg" != "${arg#*=}" ]; then
+            tokens[$service]="${arg#*=}"
+        fi
+        services+=" $service"
+    done
+    if [ -z "$services" ]; then
+        error_msg "No service to enable"
+        usage
+    fi
+
+    service_check_user
+    for service in $services; do
+        service_load "$service"
+        _service_check_can_enable "$service" "${tokens[$service]}"
+    done
+    for service in $services; do
+        if type -t "${service}_enable_repo" >/dev/null; then
+            phased+=("$service=${tokens[$service]}")
+        fi
+    done
+    if [ ${#phased[@]} -gt 0 ]; then
+        _service_enable_phases "${phased[@]}"
+    fi
+    for service in $services; do
+        if ! type -t "${service}_enable_repo" >/dev/null; then
+            "${service}_enable" "${tokens[$service]}"
+        fi
+    done
+    # shellcheck disable=SC2086
+    status_cache_refresh $services
 }
 
 service_disable() {
     local service="$1"
 
+    service_load "$service"
     service_check_user
     service_check_support "$service"
     _service_check_disabled "$service" || error_exit service_already_disabled
     shift 1
-   "${service}_disable" "$@"
+    "${service}_disable" "$@"
+    status_cache_refresh "$service"
 }
 
+# Disable several services.
+service_disable_multiple() {
+    local services="" service
+    for service in "$@"; do
+        if ! service_is_registered "$service"; then
+            error_msg "Invalid service: \"$service\""
+            usage
+        fi
+        name_in_list "${service//-/_}" "$services" || \
+            services+=" ${service//-/_}"
+    done
+    if [ -z "$services" ]; then
+        error_msg "No service to disable"
+        usage
+    fi
+
+    service_check_user
+    for service in $services; do
+        service_check_support "$service"
+        _service_check_disabled "$service" || \
+            error_exit service_already_disabled
+    done
+    for service in $services; do
+        "${service}_disable"
+    done
+    # shellcheck disable=SC2086
+    status_cache_refresh $services
+}
+
+# Return whether a service is enabled. If probing the service timed out, the
+# cached status is used if available.
 service_is_enabled() {
     local service="$1"
 
-    "${service}_is_enabled"
+    service_load "$service"
+    FACTS_TIMED_OUT=""
+    local result=0
+    "${service}_is_enabled" || result=$?
+    if [ -n "$FACTS_TIMED_OUT" ] && status_cache_load && \
+           status_cache_has_service "${service//_/-}"; then
+        status_cache_is_service_enabled "${service//_/-}"
+        return
+    fi
+    return $result
 }
 
+# Print the status of a service. If probing the service timed out, the cached
+# status is printed instead, flagged as stale.
 service_print_status() {
     local service="$1"
 
-    local series archs
-    series=$(expand_var "${service^^}_SUPPORTED_SERIES")
-    archs=$(expand_var "${service^^}_SUPPORTED_ARCHS")
+    service_load "$service"
+    FACTS_TIMED_OUT=""
 
     local status=""
     if "${service}_is_enabled"; then
         status="enabled"
     else
         status="disabled"
-        if ! is_supported "$series" "$archs"; then
+        if ! is_supported "${SERVICE_REGISTRY[$service.series]}" \
+             "${SERVICE_REGISTRY[$service.archs]}"; then
             status+=" (not available)"
         else
             status+=$(service_disabled_reason "${service}")
         fi
     fi
 
+    if [ -n "$FACTS_TIMED_OUT" ]; then
+        _service_print_stale_status "$service"
+        return
+    fi
+
     echo "${service//_/-}: $status"
     if [ "$status" = enabled ]; then
         _service_print_detailed_status "$service"
@@ -69,10 +208,18 @@ service_print_status() {
 service_disabled_reason() {
     local service="$1"
 
+    service_load "$service"
     call_if_defined "${service}_disabled_reason"
 }
 
+# Check that the tool is run as root. Commands needing it change the system,
+# so they also take the tool lock, see ua_lock.
 service_check_user() {
+    service_check_root
+    ua_lock
+}
+
+service_check_root() {
     if [ "$(id -u)" -ne 0 ]; then
         error_msg "This command must be run as root (try using sudo)"
         error_exit not_root
@@ -82,17 +229,127 @@ service_check_user() {
 service_check_support() {
     local service="$1"
 
+    service_load "$service"
     check_series_arch_supported "$service"
     call_if_defined "${service}_check_support"
 }
 
+# Check a token for the APT repository of a service, see check_token.
+service_check_token() {
+    local service="$1"
+    local token="$2"
+
+    check_token "${SERVICE_REGISTRY[$service.repo_url]}" "$token" \
+                "${KEYRINGS_DIR}/${SERVICE_REGISTRY[$service.repo_key_file]}"
+}
+
+# Add the APT repository of a service, as set in SERVICE_REGISTRY.
+service_add_repo() {
+    local service="$1"
+    local token="$2"
+
+    apt_add_repo "${SERVICE_REGISTRY[$service.repo_list]}" \
+                 "${SERVICE_REGISTRY[$service.repo_url]}" "$token" \
+                 "${KEYRINGS_DIR}/${SERVICE_REGISTRY[$service.repo_key_file]}"
+}
+
+# Update the package lists of the APT repositories of services, given as
+# "<service>=<token>" arguments. Tokens that a repository didn't authorize
+# are removed from the token cache, so that they're checked again.
+service_update_repos() {
+    local arg service
+    local -a repo_lists=()
+    for arg in "$@"; do
+        service="${arg%%=*}"
+        repo_lists+=("${SERVICE_REGISTRY[$service.repo_list]}")
+    done
+
+    local result=0
+    apt_update "${repo_lists[@]}" || result=$?
+    if [ $result -ne 0 ]; then
+        local repo_url
+        for arg in "$@"; do
+            repo_url="${SERVICE_REGISTRY[${arg%%=*}.repo_url]}"
+            if apt_update_unauthorized "$repo_url"; then
+                token_cache_remove "$repo_url" "${arg#*=}"
+            fi
+        done
+    fi
+    return $result
+}
+
+# Remove the APT repository of a service, as set in SERVICE_REGISTRY.
+service_remove_repo() {
+    local service="$1"
+
+    apt_remove_repo "${SERVICE_REGISTRY[$service.repo_list]}" \
+                    "${SERVICE_REGISTRY[$service.repo_url]}" \
+                    "$APT_KEYS_DIR/${SERVICE_REGISTRY[$service.repo_key_file]}"
+}
+
+# Enable services with an APT repository, given as "<service>=<token>"
+# arguments, in phases shared by all of them:
+#  - <service>_enable_check <token>: check that the service can be enabled
+#    (e.g. that it's not installed yet) and the token. All services are
+#    checked before changing the system
+#  - <service>_enable_repo <token>: add the repository
+#  - the package lists of the added repositories are updated
+#  - <service>_enable_packages: print the packages to install, if defined.
+#    Packages for all services are installed in a single transaction
+#  - <service>_enable_configure: configure the service, if defined
+_service_enable_phases() {
+    local services="" arg service
+    local -A tokens=()
+    for arg in "$@"; do
+        service="${arg%%=*}"
+        tokens[$service]="${arg#*=}"
+        services+=" $service"
+    done
+
+    for service in $services; do
+        "${service}_enable_check" "${tokens[$service]}"
+    done
+
+    for service in $services; do
+        "${service}_enable_repo" "${tokens[$service]}"
+    done
+    apt_install_package_if_missing_file "$APT_METHOD_HTTPS" apt-transport-https
+    apt_install_package_if_missing_file "$CA_CERTIFICATES" ca-certificates
+    service_update_repos "$@"
+
+    local packages="" titles=""
+    for service in $services; do
+        echo "${SERVICE_REGISTRY[$service.repo_title]} enabled."
+        if type -t "${service}_enable_packages" >/dev/null; then
+            packages+=" $("${service}_enable_packages")"
+            titles+="${titles:+, }${SERVICE_REGISTRY[$service.install_title]}"
+        fi
+    done
+    if [ -n "$packages" ]; then
+        echo -n "Installing ${titles} (this may take a while)... "
+        # shellcheck disable=SC2086
+        check_result apt_get install $packages
+    fi
+
+    for service in $services; do
+        call_if_defined "${service}_enable_configure"
+    done
+}
+
+_service_check_can_enable() {
+    local service="$1"
+    local token="$2"
+
+    service_check_support "$service"
+    _service_check_enabled "$service" || error_exit service_already_enabled
+    "${service}_validate_token" "$token" || error_exit invalid_token
+}
+
 _service_check_enabled() {
     local service="$1"
 
-    local title
-    title=$(expand_var "${service^^}_SERVICE_TITLE")
     if service_is_enabled "$service"; then
-        error_msg "$title is already enabled"
+        error_msg "${SERVICE_REGISTRY[$service.title]} is already enabled"
         return 1
     fi
 }
@@ -100,14 +357,22 @@ _service_check_enabled() {
 _service_check_disabled() {
     local service="$1"
 
-    local title
-    title=$(expand_var "${service^^}_SERVICE_TITLE")
     if ! service_is_enabled "$service"; then
-        error_msg "$title is not enabled"
+        error_msg "${SERVICE_REGISTRY[$service.title]} is not enabled"
         return 1
     fi
 }
 
+_service_print_stale_status() {
+    local service="${1//_/-}"
+
+    if status_cache_load && status_cache_has_service "$service"; then
+        status_cache_print "$service" stale
+    else
+        echo "${service}: unknown (status check timed out)"
+    fi
+}
+
 _service_print_detailed_status() {
     local service="$1"
 
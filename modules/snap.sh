@@ -1,8 +1,9 @@
 # shellcheck disable=SC2039
 
 check_snapd_kernel_support() {
-    declare -a version
-    mapfile -t version < <(echo -e "${KERNEL_VERSION//[.-]/\\n}")
+    local major="${KERNEL_VERSION%%[.-]*}"
+    local minor="${KERNEL_VERSION#*[.-]}"
+    minor="${minor%%[.-]*}"
     # snapd needs a 4.4.x *running* kernel
-    test "${version[0]}" -ge "4" -a "${version[1]}" -ge "4"
+    test "$major" -ge "4" -a "$minor" -ge "4"
 }
@@ -0,0 +1,324 @@
+# shellcheck disable=SC2039
+
+# Files the status of services is computed from, by input name. Their
+# modification times are recorded in the status cache, so that readers can
+# tell whether the cached data is stale. Each service lists the inputs its
+# status depends on in its "status_inputs" setting in SERVICE_REGISTRY, and
+# only services whose inputs changed need to be checked again.
+#
+# Inputs specific to a service are added by its module. Modules are sourced
+# from a function, so arrays must be declared global.
+declare -gA STATUS_CACHE_INPUTS=(
+    [dpkg]="$DPKG_STATUS_FILE"
+    [apt-sources]="$APT_SOURCES_LIST $APT_SOURCES_DIR"
+    [apt-lists]="$APT_LISTS_DIR"
+)
+# Content of the status cache data, by key. Detail lines for each service
+# are joined by newlines.
+declare -gA _STATUS_CACHE_DATA=()
+
+# Write the status of services to the cache files.
+#
+# If services are specified, or with "--changed", only the status of the
+# specified services and of those whose inputs changed is checked, and the
+# cached status of other services is kept. Otherwise the status of all
+# services is checked.
+#
+# Two files are written, each to a temporary file which is then renamed, so
+# that readers never see partial content:
+#  - UA_STATUS_CACHE, with the same content as the "status" command output
+#  - UA_STATUS_DATA, with the status of services in "key=value" lines, along
+#    with the generation time and the status inputs it was built from
+status_cache_update() {
+    local changed_only=""
+    if [ "$1" = "--changed" ]; then
+        changed_only="yes"
+        shift
+    fi
+    local services="$*"
+
+    local service
+    # load all services so that all status inputs are known
+    # shellcheck disable=SC2153
+    for service in $SERVICES; do
+        service_load "$service"
+    done
+
+    if [ -z "$changed_only" ] && [ -z "$services" ]; then
+        services="$SERVICES"
+    elif status_cache_load; then
+        services+=" $(_status_cache_outdated_services)"
+    else
+        services="$SERVICES"
+    fi
+
+    local check_services=""
+    for service in $SERVICES; do
+        if name_in_list "$service" "$services"; then
+            check_services+=" $service"
+        fi
+    done
+    if [ -z "$check_services" ]; then
+        return 0
+    fi
+
+    local generated inputs
+    printf -v generated '%(%s)T' -1
+    # fingerprint inputs before probing, so that changes made meanwhile (like
+    # by a probe) are seen on the next run
+    inputs=$(_status_cache_print_inputs)
+
+    local output line
+    local -A checked_status checked_time
+    output=$(print_status_parallel "$check_services") || true
+    while IFS= read -r line; do
+        if [[ "$line" != "  "* ]]; then
+            service="${line%%: *}"
+            # a stale status is the one probed before
+            [[ "$line" == *" (stale)" ]] || checked_time[$service]="$generated"
+        fi
+        checked_status[$service]+="${line}"$'\n'
+    done <<<"$output"
+
+    local status=""
+    for service in $SERVICES; do
+        if [ -n "${checked_status[$service]+set}" ]; then
+            status+="${checked_status[$service]}"
+        else
+            status+="$(status_cache_print "$service")"$'\n'
+        fi
+        if [ -z "${checked_time[$service]}" ]; then
+            line="${_STATUS_CACHE_DATA[$service.checked]}"
+            checked_time[$service]="${line:-${_STATUS_CACHE_DATA[generated]}}"
+        fi
+    done
+    status="${status%$'\n'}"
+
+    # the stale flag is only kept in the data file, the text one is parsed by
+    # MOTD scripts
+    local text="" line
+    while IFS= read -r line; do
+        [[ "$line" == "  "* ]] || line="${line% (stale)}"
+        text+="${line}"$'\n'
+    done <<<"$status"
+
+    {
+        echo "# ubuntu-advantage status cache, do not edit"
+        echo "generated=${generated}"
+        echo "$inputs"
+        _status_cache_print_services "$status"
+        for service in $SERVICES; do
+            echo "${service}.checked=${checked_time[$service]}"
+        done
+    } | _status_cache_write_file "$UA_STATUS_DATA"
+    echo -n "$text" | _status_cache_write_file "$UA_STATUS_CACHE"
+}
+
+# Load the status cache data. Return 1 if there's no cache.
+status_cache_load() {
+    _STATUS_CACHE_DATA=()
+    [ -r "$UA_STATUS_DATA" ] || return 1
+
+    local line key value
+    while IFS= read -r line; do
+        [[ "$line" == *=* ]] || continue
+        key="${line%%=*}"
+        value="${line#*=}"
+        if [[ "$key" == *.detail ]]; then
+            _STATUS_CACHE_DATA[$key]+="${value}"$'\n'
+        else
+            _STATUS_CACHE_DATA[$key]="$value"
+        fi
+    done <"$UA_STATUS_DATA"
+    [ -n "${_STATUS_CACHE_DATA[generated]}" ]
+}
+
+# Return whether the status of the specified services in the loaded cache was
+# checked not longer ago than the specified number of seconds (if given), and
+# their inputs didn't change since the cache was generated.
+status_cache_is_fresh() {
+    local max_age="$1"
+    local services="$2"
+
+    local now
+    printf -v now '%(%s)T' -1
+    if [ -n "$max_age" ] && \
+           [ $((now - _STATUS_CACHE_DATA[generated])) -gt "$max_age" ]; then
+        return 1
+    fi
+
+    local service checked inputs=""
+    for service in $services; do
+        # a stale status is refreshed, even if inputs didn't change
+        [ -z "${_STATUS_CACHE_DATA[$service.stale]}" ] || return 1
+        # services not checked in a partial refresh keep their previous time
+        # (caches written before it was recorded only have the generation one)
+        checked="${_STATUS_CACHE_DATA[$service.checked]}"
+        checked="${checked:-${_STATUS_CACHE_DATA[generated]}}"
+        if [ -n "$max_age" ] && [ $((now - checked)) -gt "$max_age" ]; then
+            return 1
+        fi
+        service_load "$service"
+        inputs+=" ${SERVICE_REGISTRY[${service//-/_}.status_inputs]}"
+    done
+    [ -z "$(_status_cache_changed_inputs "$inputs")" ]
+}
+
+# Print the cached status of the specified services, in the same format as
+# the status command. The status is flagged as stale if it was cached after a
+# probe timed out, or if "stale" is passed. Return 1 if any of them is not in
+# the cache.
+status_cache_print() {
+    local services="$1"
+    local stale="$2"
+
+    local service line
+    for service in $services; do
+        status_cache_has_service "$service" || return 1
+    done
+    for service in $services; do
+        if [ -n "$stale" ] || [ -n "${_STATUS_CACHE_DATA[$service.stale]}" ]; then
+            echo "${service}: ${_STATUS_CACHE_DATA[$service.status]} (stale)"
+        else
+            echo "${service}: ${_STATUS_CACHE_DATA[$service.status]}"
+        fi
+        [ -n "${_STATUS_CACHE_DATA[$service.detail]}" ] || continue
+        # indent output
+        while IFS= read -r line; do
+            echo "  $line"
+        done <<<"${_STATUS_CACHE_DATA[$service.detail]%$'\n'}"
+    done
+}
+
+# Return whether the status of a service is in the loaded cache.
+status_cache_has_service() {
+    local service="$1"
+
+    [ -n "${_STATUS_CACHE_DATA[$service.status]+set}" ]
+}
+
+# Return whether a service is enabled according to the loaded cache.
+status_cache_is_service_enabled() {
+    local service="$1"
+
+    [ "${_STATUS_CACHE_DATA[$service.status]}" = "enabled" ]
+}
+
+# Refresh the status cache for services that were just enabled or disabled,
+# if the cache can be written.
+status_cache_refresh() {
+    local services=("${@//_/-}")
+
+    if [ -w "${UA_STATUS_DATA%/*}" ]; then
+        # the system changed, don't use information probed before
+        facts_reset
+        dpkg_status_reset
+        apt_sources_index_reset
+        status_cache_update "${services[@]}" >/dev/null 2>&1 || true
+    fi
+}
+
+# Print services that are not in the loaded cache, or whose inputs changed.
+# Service modules must be loaded.
+_status_cache_outdated_services() {
+    local changed_inputs
+    changed_inputs=$(_status_cache_changed_inputs)
+
+    local service input
+    for service in $SERVICES; do
+        # also check again services whose status is stale or unknown
+        if ! status_cache_has_service "$service" || \
+               [ -n "${_STATUS_CACHE_DATA[$service.stale]}" ] || \
+               [[ "${_STATUS_CACHE_DATA[$service.status]}" == unknown* ]]; then
+            echo "$service"
+            continue
+        fi
+        for input in ${SERVICE_REGISTRY[${service//-/_}.status_inputs]}; do
+            if name_in_list "$input" "$changed_inputs"; then
+                echo "$service"
+                break
+            fi
+        done
+    done
+}
+
+# Print names of inputs that changed since the loaded cache was generated,
+# out of the specified ones (or all known inputs).
+_status_cache_changed_inputs() {
+    local inputs="$1"
+
+    local line
+    while IFS= read -r line; do
+        if [ "${_STATUS_CACHE_DATA[${line%%=*}]}" != "${line#*=}" ]; then
+            line="${line%%=*}"
+            echo "${line#input.}"
+        fi
+    done < <(_status_cache_print_inputs "$inputs")
+}
+
+# Print "input.<name>=<fingerprint>" lines for the specified status inputs
+# (or all known inputs). The fingerprint of an input is the list of
+# modification times of its files (0 for missing ones).
+_status_cache_print_inputs() {
+    local inputs="$1"
+
+    local input
+    local -a paths=()
+    if [ -z "${inputs// /}" ]; then
+        inputs="${!STATUS_CACHE_INPUTS[*]}"
+    fi
+    for input in $inputs; do
+        # shellcheck disable=SC2206
+        paths+=(${STATUS_CACHE_INPUTS[$input]})
+    done
+
+    local -A mtimes
+    local path mtime
+    while read -r mtime path; do
+        mtimes[$path]="$mtime"
+    done < <(stat -L -c '%Y %n' "${paths[@]}" 2>/dev/null)
+
+    local fingerprint
+    for input in $inputs; do
+        fingerprint=""
+        for path in ${STATUS_CACHE_INPUTS[$input]}; do
+            fingerprint+="${fingerprint:+,}${mtimes[$path]:-0}"
+        done
+        echo "input.${input}=${fingerprint}"
+    done
+}
+
+# Print "<service>.status=<status>" and "<service>.detail=<line>" lines from
+# the output of the status command.
+_status_cache_print_services() {
+    local status="$1"
+
+    local line service=""
+    while IFS= read -r line; do
+        if [ -z "$line" ]; then
+            continue
+        elif [[ "$line" == "  "* ]]; then
+            echo "${service}.detail=${line#  }"
+        elif [[ "$line" == *" (stale)" ]]; then
+            service="${line%%: *}"
+            line="${line% (stale)}"
+            echo "${service}.status=${line#*: }"
+            echo "${service}.stale=yes"
+        else
+            service="${line%%: *}"
+            echo "${service}.status=${line#*: }"
+        fi
+    done <<<"$status"
+}
+
+# Atomically replace a file with content from stdin.
+_status_cache_write_file() {
+    local file="$1"
+
+    local tempfile
+    mkdir -p "$(dirname "$file")"
+    tempfile=$(mktemp "${file}.XXXXXX")
+    cat >"$tempfile"
+    chmod 644 "$tempfile"
+    mv -f "$tempfile" "$file"
+}
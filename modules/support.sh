@@ -10,16 +10,13 @@ not_supported() {
 check_series_arch_supported() {
     local service="$1"
 
-    local title supported_series supported_archs
-    title=$(expand_var "${service^^}_SERVICE_TITLE")
-    supported_series=$(expand_var "${service^^}_SUPPORTED_SERIES")
-    supported_archs=$(expand_var "${service^^}_SUPPORTED_ARCHS")
+    local title="${SERVICE_REGISTRY[$service.title]}"
 
-    if ! is_supported_arch "$supported_archs"; then
+    if ! is_supported_arch "${SERVICE_REGISTRY[$service.archs]}"; then
         error_msg "Sorry, but $title is not supported on $ARCH"
         error_exit arch_not_supported
     fi
-    if ! is_supported_series "$supported_series"; then
+    if ! is_supported_series "${SERVICE_REGISTRY[$service.series]}"; then
         error_msg "Sorry, but $title is not supported on $SERIES"
         error_exit release_not_supported
     fi
@@ -17,6 +17,7 @@ error_exit() {
         [arch_not_supported]=7
         [service_already_disabled]=8
         [livepatch_unsupported_kernel]=9
+        [lock_timeout]=10
     )
     exit "${codes[$code]}"
 }
@@ -56,6 +57,93 @@ check_result() {
     fi
 }
 
+# Take the tool lock (on file descriptor 9), so that commands changing the
+# system run one at a time, waiting up to UA_LOCK_TIMEOUT seconds for other
+# ones to finish. With "nowait", return 1 instead of waiting if the lock is
+# held. The lock is released when the tool exits. Commands run by the tool,
+# like apt hooks refreshing the status cache, don't take it again.
+ua_lock() {
+    local mode="$1"
+
+    [ -z "$UA_LOCK_HELD" ] || return 0
+    type -P flock >/dev/null || return 0
+    { exec 9>>"$UA_LOCK_FILE"; } 2>/dev/null || return 0
+
+    if ! flock -n 9; then
+        if [ "$mode" = nowait ]; then
+            exec 9>&-
+            return 1
+        fi
+        echo -n "Waiting for another ${SCRIPTNAME} command to finish... "
+        if ! flock -w "$UA_LOCK_TIMEOUT" 9; then
+            echo "ERROR"
+            error_msg "Timed out waiting for the lock on $UA_LOCK_FILE"
+            error_exit lock_timeout
+        fi
+        echo "OK"
+    fi
+    export UA_LOCK_HELD=1
+}
+
+# Run a command, stopping it if it takes longer than UA_PROBE_TIMEOUT seconds.
+# The exit status is 124 if it was stopped.
+run_with_timeout() {
+    if [ "${UA_PROBE_TIMEOUT:-0}" -gt 0 ] && type -P timeout >/dev/null; then
+        timeout -k 1 "$UA_PROBE_TIMEOUT" "$@"
+    else
+        "$@"
+    fi
+}
+
+# Run a command up to UA_FETCH_ATTEMPTS times while it fails with a transient
+# error, as told by the function named by the second argument (called with the
+# exit status and the output file). The delay before each retry doubles,
+# starting from UA_FETCH_RETRY_DELAY seconds, with random jitter so that many
+# machines don't retry at the same time. The output of the last attempt is
+# written to the file named by the first argument. RETRY_ATTEMPTS and
+# RETRY_TIME_MS are set to the number of attempts and the time they took.
+retry_transient() {
+    local output_file="$1"
+    local is_transient="$2"
+    shift 2
+
+    local start end result delay_ms sleep_ms delay
+    start=$(date +%s%3N)
+    RETRY_ATTEMPTS=0
+    while true; do
+        RETRY_ATTEMPTS=$((RETRY_ATTEMPTS + 1))
+        result=0
+        "$@" >"$output_file" 2>&1 || result=$?
+        if [ $result -eq 0 ] || \
+               [ "$RETRY_ATTEMPTS" -ge "$UA_FETCH_ATTEMPTS" ] || \
+               ! "$is_transient" "$result" "$output_file"; then
+            break
+        fi
+        # wait between half and all of the delay
+        delay_ms=$((UA_FETCH_RETRY_DELAY * 1000 << (RETRY_ATTEMPTS - 1)))
+        sleep_ms=$((delay_ms / 2 + RANDOM % (delay_ms / 2 + 1)))
+        printf -v delay '%d.%03d' $((sleep_ms / 1000)) $((sleep_ms % 1000))
+        sleep "$delay"
+    done
+    end=$(date +%s%3N)
+    RETRY_TIME_MS=$((end - start))
+    return $result
+}
+
+# Print "OK" or "ERROR" like check_result for an exit status, along with the
+# number of attempts and the time taken by the last retry_transient call if
+# it retried.
+retry_print_result() {
+    local result="$1"
+
+    local text="OK"
+    [ "$result" -eq 0 ] || text="ERROR"
+    if [ "$RETRY_ATTEMPTS" -gt 1 ]; then
+        text+=" (${RETRY_ATTEMPTS} attempts in ${RETRY_TIME_MS} ms)"
+    fi
+    echo "$text"
+}
+
 call_if_defined() {
     local command="$1"
 
@@ -75,9 +163,3 @@ name_in_list() {
     done
     return 1
 }
-
-expand_var() {
-    local var="$1"
-
-    echo "${!var}"
-}
@@ -98,21 +98,33 @@ fi
 exit 0
 """
 
-ESM_DISABLED = """
-echo "500 http://archive.ubuntu.com/ubuntu precise/main amd64 Packages"
-"""
-
-
-ESM_ENABLED = """
+APT_POLICY_ESM_ENABLED = """
 echo "500 https://esm.ubuntu.com/ubuntu precise/main amd64 Packages"
 """
 
+# FIPS_HMAC_PACKAGES and FIPS_OTHER_PACKAGES in modules/service-fips.sh
+FIPS_PACKAGES = [
+    'openssh-client-hmac', 'openssh-server-hmac', 'libssl1.0.0-hmac',
+    'linux-fips', 'strongswan-hmac', 'openssh-client', 'openssh-server',
+    'openssl', 'libssl1.0.0', 'fips-initramfs', 'strongswan']
+
 APT_GET_LOG_WRAPPER = """
 log_path=$(dirname "$0")/../
 echo -- "$@" >> "${log_path}/apt_get.args"
 env >> "${log_path}/apt_get.env"
 """
 
+# also log the source list files apt-get reads, when they're overridden
+APT_GET_LOG_SOURCES_WRAPPER = APT_GET_LOG_WRAPPER + """
+for arg; do
+    case "$arg" in
+        Dir::Etc::sourceparts=*)
+            ls "${arg#*=}" >> "${log_path}/apt_get.sources"
+            ;;
+    esac
+done
+"""
+
 LIVEPATCH_ENABLED_STATUS = """
 cat <<EOF
 client-version: "7.23"
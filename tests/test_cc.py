@@ -184,3 +184,18 @@ class CCTest(UbuntuAdvantageTest):
         self.assertIn(
             'Canonical Common Criteria EAL2 Provisioning is not enabled\n',
             process.stderr)
+
+    def test_is_cc_provisioning_enabled(self):
+        """is-cc-provisioning-enabled checks the installed package."""
+        self.setup_cc(enabled=True)
+        process = self.script('is-cc-provisioning-enabled')
+        self.assertEqual(0, process.returncode)
+
+    def test_is_cc_provisioning_enabled_config_files_only(self):
+        """A removed package with config files left is not installed."""
+        self.dpkg_status_file.write_text(
+            'Package: ubuntu-commoncriteria\n'
+            'Status: deinstall ok config-files\n'
+            'Version: 1.0\n')
+        process = self.script('is-cc-provisioning-enabled')
+        self.assertEqual(1, process.returncode)
@@ -0,0 +1,142 @@
+"""Tests for the check-tokens command."""
+
+from testing import UbuntuAdvantageTest
+
+
+# fail fetching from the FIPS repository with the specified error
+APT_HELPER_FIPS_ERROR = """
+case "$2" in
+    */fips/*)
+        echo "E: Failed to fetch https://private-ppa.launchpad.net/  {}"
+        exit 1
+        ;;
+esac
+"""
+
+
+class CheckTokensTest(UbuntuAdvantageTest):
+
+    SERIES = 'xenial'
+    ARCH = 'x86_64'
+
+    def parse_output(self, output):
+        """Parse "key=value" output lines into a dict."""
+        return dict(line.split('=', 1) for line in output.splitlines())
+
+    def test_check_tokens(self):
+        """The result of each token check is reported."""
+        process = self.script(
+            'check-tokens', 'esm=user:pass', 'fips-updates=user:pass',
+            'cisaudit=user:pass')
+        self.assertEqual(0, process.returncode)
+        result = self.parse_output(process.stdout)
+        self.assertEqual(
+            ['esm.result', 'esm.attempts', 'esm.time_ms',
+             'fips-updates.result', 'fips-updates.attempts',
+             'fips-updates.time_ms', 'cisaudit.result', 'cisaudit.attempts',
+             'cisaudit.time_ms'],
+            list(result))
+        self.assertEqual('ok', result['esm.result'])
+        self.assertEqual('ok', result['fips-updates.result'])
+        self.assertEqual('ok', result['cisaudit.result'])
+        self.assertEqual('1', result['esm.attempts'])
+        self.assertTrue(result['esm.time_ms'].isdigit())
+
+    def test_check_tokens_invalid_token(self):
+        """Tokens rejected by the repository are reported as invalid."""
+        self.make_fake_binary(
+            'apt-helper',
+            command=APT_HELPER_FIPS_ERROR.format('401  Unauthorized'))
+        process = self.script(
+            'check-tokens', 'fips=user:pass', 'esm=user:pass')
+        self.assertEqual(3, process.returncode)
+        result = self.parse_output(process.stdout)
+        self.assertEqual('invalid-token', result['fips.result'])
+        self.assertEqual('401  Unauthorized', result['fips.error'])
+        self.assertEqual('ok', result['esm.result'])
+
+    def test_check_tokens_error(self):
+        """Other failures are reported as errors."""
+        self.make_fake_binary(
+            'apt-helper',
+            command=APT_HELPER_FIPS_ERROR.format('404  Not Found'))
+        process = self.script('check-tokens', 'fips=user:pass')
+        self.assertEqual(3, process.returncode)
+        result = self.parse_output(process.stdout)
+        self.assertEqual('error', result['fips.result'])
+        self.assertEqual('404  Not Found', result['fips.error'])
+
+    def test_check_tokens_invalid_format(self):
+        """Tokens not in the user:password form are not checked."""
+        self.make_fake_binary('apt-helper', command='exit 1')
+        process = self.script('check-tokens', 'esm=invalid')
+        self.assertEqual(3, process.returncode)
+        result = self.parse_output(process.stdout)
+        self.assertEqual('invalid-token', result['esm.result'])
+
+    def test_check_tokens_no_apt_helper(self):
+        """Checks are skipped if apt-helper is not available."""
+        self.apt_helper.unlink()
+        process = self.script('check-tokens', 'esm=user:pass')
+        self.assertEqual(0, process.returncode)
+        self.assertIn('esm.result=skipped', process.stdout)
+
+    def test_check_tokens_jobs(self):
+        """The number of concurrent checks can be limited."""
+        process = self.script(
+            'check-tokens', '--jobs', '1', 'esm=user:pass',
+            'fips=user:pass', 'cc-provisioning=user:pass')
+        self.assertEqual(0, process.returncode)
+        result = self.parse_output(process.stdout)
+        self.assertEqual('ok', result['cc-provisioning.result'])
+
+    def test_check_tokens_invalid_jobs(self):
+        """The number of jobs must be a positive number."""
+        process = self.script('check-tokens', '--jobs', '0', 'esm=user:pass')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid number of jobs "0"', process.stderr)
+
+    def test_check_tokens_missing_jobs(self):
+        """An error is reported if the number of jobs is missing."""
+        process = self.script('check-tokens', 'esm=user:pass', '--jobs')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid number of jobs ""', process.stderr)
+
+    def test_check_tokens_timeout(self):
+        """Token checks which time out are reported as errors."""
+        self.make_fake_binary('apt-helper', command='sleep 10')
+        process = self.script(
+            'check-tokens', 'esm=user:pass',
+            env_update={'UA_PROBE_TIMEOUT': '1'})
+        self.assertEqual(3, process.returncode)
+        self.assertIn('esm.result=error\n', process.stdout)
+        self.assertIn(
+            'esm.error=timed out after 1 seconds\n', process.stdout)
+
+    def test_check_tokens_retry(self):
+        """Token checks failing with transient errors are retried."""
+        self.make_fake_binary(
+            'apt-helper', command='echo "E: Failed to fetch '
+            'https://esm.ubuntu.com/  HttpError503 Service Unavailable"; '
+            'exit 100')
+        process = self.script('check-tokens', 'esm=user:pass')
+        self.assertEqual(3, process.returncode)
+        result = self.parse_output(process.stdout)
+        self.assertEqual('error', result['esm.result'])
+        self.assertEqual(
+            'HttpError503 Service Unavailable', result['esm.error'])
+        self.assertEqual('3', result['esm.attempts'])
+
+    def test_check_tokens_invalid_service(self):
+        """Only services with a repository token can be checked."""
+        process = self.script('check-tokens', 'livepatch=token')
+        self.assertEqual(1, process.returncode)
+        self.assertIn(
+            'Invalid service with a repository token: "livepatch"',
+            process.stderr)
+
+    def test_check_tokens_no_services(self):
+        """At least one token is required."""
+        process = self.script('check-tokens')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('No service token to check', process.stderr)
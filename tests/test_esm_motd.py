@@ -0,0 +1,110 @@
+"""Tests for the ESM MOTD"""
+
+from testing import UbuntuAdvantageTest
+
+LSB_RELEASE = """\
+DISTRIB_ID=Ubuntu
+DISTRIB_RELEASE=12.04
+DISTRIB_CODENAME={series}
+DISTRIB_DESCRIPTION="Ubuntu 12.04.5 LTS"
+"""
+
+OS_RELEASE = """\
+NAME="Ubuntu"
+VERSION="12.04.5 LTS, Precise Pangolin"
+ID=ubuntu
+PRETTY_NAME="Ubuntu precise (12.04.5 LTS)"
+VERSION_CODENAME={series}
+"""
+
+ESM_ENABLED_MESSAGE = (
+    'This Ubuntu 12.04.5 LTS system is configured to receive extended '
+    'security updates\nfrom Canonical:\n * https://www.ubuntu.com/esm\n\n')
+ESM_DISABLED_MESSAGE = (
+    'This Ubuntu 12.04.5 LTS system is past its End of Life, and is no '
+    'longer\nreceiving security updates.')
+
+
+class ESMMOTDTest(UbuntuAdvantageTest):
+
+    SERIES = 'precise'
+    SCRIPT = 'update-motd.d/80-esm'
+
+    def setUp(self):
+        super().setUp()
+        self.lsb_release_file.write_text(LSB_RELEASE.format(series='precise'))
+
+    def write_cached_status(self, status):
+        """Write the ESM status to the status cache data."""
+        self.ua_status_data.write_text(
+            'generated=1000\nesm.status={}\n'.format(status))
+
+    def test_enabled(self):
+        """The MOTD tells that ESM updates are received if enabled."""
+        self.write_cached_status('enabled')
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(ESM_ENABLED_MESSAGE, process.stdout)
+
+    def test_disabled(self):
+        """The MOTD suggests enabling ESM if it's disabled."""
+        self.write_cached_status('disabled')
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        self.assertIn(ESM_DISABLED_MESSAGE, process.stdout)
+
+    def test_other_series(self):
+        """The MOTD is empty on series other than precise."""
+        self.lsb_release_file.write_text(LSB_RELEASE.format(series='xenial'))
+        self.write_cached_status('disabled')
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('', process.stdout)
+
+    def test_os_release(self):
+        """If lsb-release is missing, os-release is used."""
+        self.lsb_release_file.unlink()
+        self.os_release_file.write_text(OS_RELEASE.format(series='precise'))
+        self.write_cached_status('disabled')
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        self.assertIn(
+            'This Ubuntu precise (12.04.5 LTS) system is past its End of '
+            'Life', process.stdout)
+
+    def test_no_release_file(self):
+        """The MOTD is empty if the series can't be found."""
+        self.lsb_release_file.unlink()
+        self.write_cached_status('disabled')
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('', process.stdout)
+
+    def test_ua_script_not_installed(self):
+        """The MOTD is empty if there is no ubuntu-advantage script."""
+        self.write_cached_status('disabled')
+        process = self.script(env_update={'UA': '/does/not/exist'})
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('', process.stdout)
+
+    def test_cached_status_no_external_commands(self):
+        """With a cached status, external commands are not run."""
+        self.write_cached_status('enabled')
+        process = self.script(env_update={'PATH': str(self.etc_dir)})
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(ESM_ENABLED_MESSAGE, process.stdout)
+
+    def test_no_cache(self):
+        """Without a cached status, the status is checked by the script."""
+        self.setup_esm(enabled=True)
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(ESM_ENABLED_MESSAGE, process.stdout)
+
+    def test_no_cache_check_timeout(self):
+        """Without a cached status, the status check is time-limited."""
+        self.make_fake_binary('ua-slow', command='sleep 10')
+        process = self.script(env_update={
+            'UA': str(self.bin_dir / 'ua-slow'), 'ESM_CHECK_TIMEOUT': '1'})
+        self.assertEqual(0, process.returncode)
+        self.assertIn(ESM_DISABLED_MESSAGE, process.stdout)
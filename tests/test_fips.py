@@ -1,6 +1,7 @@
 """Tests for FIPS-related commands."""
 
 from testing import UbuntuAdvantageTest
+from fakes import APT_GET_LOG_WRAPPER, FIPS_PACKAGES
 
 
 class FIPSTest(UbuntuAdvantageTest):
@@ -74,8 +75,9 @@ class FIPSTest(UbuntuAdvantageTest):
 
     def test_enable_fips_not_all_packages_installed(self):
         # one of the packages is not installed
-        self.make_fake_binary(
-            'dpkg-query', command='[ $2 != openssh-client-hmac ]')
+        self.setup_packages(
+            [package for package in FIPS_PACKAGES
+             if package != 'openssh-client-hmac'])
         process = self.script('enable-fips', 'user:pass')
         self.assertEqual(process.returncode, 0)
         self.assertIn('Installing FIPS packages', process.stdout)
@@ -298,6 +300,28 @@ class FIPSTest(UbuntuAdvantageTest):
             'Please reboot into the new FIPS kernel',
             process.stdout)
 
+    def test_update_fips_single_transaction(self):
+        """FIPS packages are updated in a single apt-get transaction."""
+        self.setup_packages(['libssl1.0.0', 'openssh-client'])
+        self.make_fake_binary('apt-get', command=APT_GET_LOG_WRAPPER)
+        process = self.script('enable-fips-updates', 'user:pass', '-y')
+        self.assertEqual(0, process.returncode)
+        installs = [
+            line for line in self.read_file('apt_get.args').splitlines()
+            if ' install ' in line]
+        self.assertEqual(
+            ['-- -y -o Dpkg::Options::=--force-confold install linux-fips'
+             ' fips-initramfs openssl libssl1.0.0 libssl1.0.0-hmac'
+             ' openssh-client openssh-client-hmac'],
+            installs)
+        self.assertIn(
+            'Updating FIPS packages (this may take a while)... OK\n'
+            'FIPS OpenSSL packages updated.\n'
+            'FIPS OpenSSH-client packages updated.\n',
+            process.stdout)
+        self.assertNotIn('OpenSSH-server', process.stdout)
+        self.assertNotIn('Strongswan', process.stdout)
+
     def test_update_fips_auth_if_other_entries(self):
         """Existing auth.conf entries are preserved."""
         auth = 'machine example.com login user password pass\n'
@@ -335,6 +359,14 @@ class FIPSTest(UbuntuAdvantageTest):
             'Sorry, but Canonical FIPS 140-2 Modules is not supported on i686',
             process.stderr)
 
+    def test_disable_fips_updates_invalid(self):
+        """FIPS-UPDATES can only be enabled."""
+        for command in ('disable-fips-updates', 'is-fips-updates-enabled'):
+            process = self.script(command)
+            self.assertEqual(1, process.returncode)
+            self.assertIn(
+                'Invalid command: "{}"'.format(command), process.stderr)
+
     def test_update_fips_missing_token(self):
         """The token must be specified when using enable-fips-updates."""
         process = self.script('enable-fips-updates')
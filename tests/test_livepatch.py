@@ -1,5 +1,7 @@
 """Tests for Livepatch-related commands."""
 
+import os
+
 from testing import UbuntuAdvantageTest
 from fakes import (APT_GET_LOG_WRAPPER, LIVEPATCH_UNSUPPORTED_KERNEL,
                    LIVEPATCH_UNKNOWN_ERROR)
@@ -233,9 +235,7 @@ class LivepatchTest(UbuntuAdvantageTest):
         # this is LIVEPATCH_FALLBACK_KERNEL in modules/service-livepatch.sh
         LIVEPATCH_FALLBACK_KERNEL = 'linux-image-generic'
         # the fallback kernel is not installed
-        self.make_fake_binary(
-            'dpkg-query',
-            command='[ $2 != {} ]'.format(LIVEPATCH_FALLBACK_KERNEL))
+        self.setup_packages([])
         self.setup_livepatch(
             installed=True, enabled=False,
             livepatch_command=LIVEPATCH_UNSUPPORTED_KERNEL)
@@ -251,6 +251,57 @@ class LivepatchTest(UbuntuAdvantageTest):
                       process.stdout)
         self.assertEqual(9, process.returncode)
 
+    def test_unsupported_kernel_change_allowed_lists_updated_by_apt(self):
+        """
+        Package lists are not updated before installing the fallback kernel
+        if apt updated them recently, after sources last changed.
+        """
+        self.SERIES = 'xenial'
+        self.KERNEL_VERSION = '4.15.0-1010-kvm'
+        self.setup_packages([])
+        self.setup_livepatch(
+            installed=True, enabled=False,
+            livepatch_command=LIVEPATCH_UNSUPPORTED_KERNEL)
+        os.utime(str(self.apt_sources_dir), (0, 0))
+        self.apt_update_success_stamp.write_text('')
+        process = self.script('enable-livepatch', self.livepatch_token,
+                              '--allow-kernel-change')
+        self.assertIn(
+            'Running apt-get update... SKIPPED (package lists are up to date)',
+            process.stdout)
+        # sources changed since the update
+        self.apt_sources_list.write_text('')
+        os.utime(str(self.apt_update_success_stamp), (1, 1))
+        process = self.script('enable-livepatch', self.livepatch_token,
+                              '--allow-kernel-change')
+        self.assertIn('Running apt-get update... OK', process.stdout)
+
+    def test_unsupported_kernel_change_allowed_lists_updated_by_tool(self):
+        """
+        Package lists are updated before installing the fallback kernel if
+        apt last updated only the lists of a repository enabled by the tool.
+        """
+        self.SERIES = 'xenial'
+        self.KERNEL_VERSION = '4.15.0-1010-kvm'
+        self.setup_cisaudit()
+        self.setup_livepatch(
+            installed=True, enabled=False,
+            livepatch_command=LIVEPATCH_UNSUPPORTED_KERNEL)
+        # apt touches the stamp after any successful update
+        self.make_fake_binary(
+            'apt-get', command='case " $* " in *" update "*) touch {};; '
+            'esac'.format(self.apt_update_success_stamp))
+        process = self.script('enable-cisaudit', 'user:pass')
+        self.assertEqual(0, process.returncode)
+        for path in (self.apt_sources_list, self.apt_sources_dir,
+                     self.cisaudit_repo_list, self.apt_auth_file):
+            if path.exists():
+                os.utime(str(path), (0, 0))
+        self.setup_packages([])
+        process = self.script('enable-livepatch', self.livepatch_token,
+                              '--allow-kernel-change')
+        self.assertIn('Running apt-get update... OK', process.stdout)
+
     def test_unsupported_kernel_change_allowed_fallback_installed(self):
         """
         Enabling livepatch with an unsupported kernel, but allowing the
@@ -263,9 +314,7 @@ class LivepatchTest(UbuntuAdvantageTest):
         # this is LIVEPATCH_FALLBACK_KERNEL in modules/service-livepatch.sh
         LIVEPATCH_FALLBACK_KERNEL = 'linux-image-generic'
         # the fallback kernel is installed
-        self.make_fake_binary(
-            'dpkg-query',
-            command='[ $2 = {} ]'.format(LIVEPATCH_FALLBACK_KERNEL))
+        self.setup_packages([LIVEPATCH_FALLBACK_KERNEL])
         self.setup_livepatch(
             installed=True, enabled=False,
             livepatch_command=LIVEPATCH_UNSUPPORTED_KERNEL)
@@ -79,6 +79,18 @@ class LivepatchMOTDTest(UbuntuAdvantageTest):
         for line in LIVEPATCH_STATE_MESSAGES['check-state-unknown']:
             self.assertIn(line.format(""), process.stdout)
 
+    def test_stale_status(self):
+        """A status flagged as stale is shown as the last known one."""
+        self.ua_status_cache.write_text(
+            STATUS_CACHE_LIVEPATCH_ENABLED.format(
+                check_state='checked', patch_state='applied').replace(
+                    'livepatch: enabled', 'livepatch: enabled (stale)'))
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        for line in LIVEPATCH_STATE_MESSAGES['checked']['applied']:
+            self.assertIn(line, process.stdout)
+        self.assertNotIn('unknown state', process.stdout)
+
     def test_disabled_but_available(self):
         """Livepatch is disabled but available for installation."""
         self.ua_status_cache.write_text(
@@ -121,6 +133,25 @@ class LivepatchMOTDTest(UbuntuAdvantageTest):
             self.assertIn(line, process.stdout)
         self.assertNotIn('should-not-be-here', process.stdout)
 
+    def test_state_fields_after_livepatch_ignored(self):
+        """The MOTD script ignores *State fields after the livepatch block."""
+        self.ua_status_cache.write_text(
+            STATUS_CACHE_LIVEPATCH_ENABLED_NO_CONTENT +
+            'other: enabled\n    checkState: should-not-be-here\n')
+        process = self.script()
+        self.assertEqual(0, process.returncode)
+        for line in LIVEPATCH_STATE_MESSAGES['check-state-unknown']:
+            self.assertIn(line.format(''), process.stdout)
+        self.assertNotIn('should-not-be-here', process.stdout)
+
+    def test_no_external_commands(self):
+        """The MOTD script doesn't run external commands."""
+        process = self.script(env_update={'PATH': str(self.etc_dir)})
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('', process.stderr)
+        for line in LIVEPATCH_STATE_MESSAGES['checked']['applied']:
+            self.assertIn(line, process.stdout)
+
     def test_ua_script_without_livepatch(self):
         """MOTD is empty if there is no livepatch section in ua's output."""
         self.ua_status_cache.write_text(STATUS_CACHE_NO_LIVEPATCH)
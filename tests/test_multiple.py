@@ -0,0 +1,142 @@
+"""Tests for commands enabling or disabling several services."""
+
+from testing import UbuntuAdvantageTest
+from fakes import APT_GET_LOG_WRAPPER
+
+
+class MultipleServicesTest(UbuntuAdvantageTest):
+
+    SERIES = 'xenial'
+    ARCH = 'x86_64'
+
+    def test_enable(self):
+        """The enable command enables several services."""
+        process = self.script(
+            'enable', 'cc-provisioning=user:pass', 'cisaudit=user:pass')
+        self.assertEqual(0, process.returncode)
+        self.assertIn(
+            'Ubuntu Common Criteria PPA repository enabled.', process.stdout)
+        self.assertIn(
+            'Ubuntu Security Benchmarks PPA repository enabled.',
+            process.stdout)
+        self.assertIn(
+            'Installing Common Criteria artifacts, CIS audit benchmark tool'
+            ' (this may take a while)... OK',
+            process.stdout)
+        self.assertIn('Successfully installed the CIS audit tool.',
+                      process.stdout)
+        self.assertTrue(self.cc_repo_list.exists())
+        self.assertTrue(self.cisaudit_repo_list.exists())
+
+    def test_enable_single_update_and_install(self):
+        """Package lists are updated once, and packages installed together."""
+        self.cpuinfo.write_text('flags\t\t: fpu aes apic')
+        self.make_fake_binary('apt-get', command=APT_GET_LOG_WRAPPER)
+        process = self.script(
+            'enable', 'fips=user:pass', 'cc-provisioning=user:pass',
+            'cisaudit=user:pass')
+        self.assertEqual(0, process.returncode)
+        calls = self.read_file('apt_get.args').splitlines()
+        self.assertEqual(
+            1, len([call for call in calls if ' update ' in call]))
+        installs = [call for call in calls if ' install ' in call]
+        self.assertEqual(1, len(installs))
+        self.assertIn('linux-fips', installs[0])
+        self.assertIn('ubuntu-commoncriteria', installs[0])
+        self.assertIn('ubuntu-cisbenchmark-16.04', installs[0])
+        self.assertIn('Successfully configured FIPS.', process.stdout)
+
+    def test_enable_invalid_token(self):
+        """Nothing is enabled if the token of a service is invalid."""
+        process = self.script(
+            'enable', 'cc-provisioning=user:pass', 'cisaudit=invalid')
+        self.assertEqual(3, process.returncode)
+        self.assertIn('Invalid token', process.stderr)
+        self.assertFalse(self.cc_repo_list.exists())
+
+    def test_enable_token_rejected(self):
+        """Nothing is enabled if the repository rejects a token."""
+        self.make_fake_binary(
+            'apt-helper',
+            command='case "$2" in *private-ppa*fips*) echo "E: Failed to '
+            'fetch $2  401  Unauthorized"; exit 100;; esac')
+        self.cpuinfo.write_text('flags\t\t: fpu aes apic')
+        process = self.script(
+            'enable', 'cisaudit=user:pass', 'fips=user:pass')
+        self.assertEqual(3, process.returncode)
+        self.assertIn('Invalid token', process.stderr)
+        self.assertFalse(self.cisaudit_repo_list.exists())
+        self.assertFalse(self.apt_auth_file.exists())
+
+    def test_enable_fips_installed(self):
+        """Nothing is enabled if a service is already installed."""
+        self.setup_packages([
+            'openssh-client-hmac', 'openssh-server-hmac',
+            'libssl1.0.0-hmac', 'linux-fips', 'strongswan-hmac'])
+        self.fips_enabled_file.write_text('0')
+        self.cpuinfo.write_text('flags\t\t: fpu aes apic')
+        process = self.script(
+            'enable', 'cisaudit=user:pass', 'fips=user:pass')
+        self.assertEqual(6, process.returncode)
+        self.assertIn('FIPS is already installed', process.stderr)
+        self.assertFalse(self.cisaudit_repo_list.exists())
+        self.assertFalse(self.apt_auth_file.exists())
+
+    def test_enable_missing_token(self):
+        """A token is required for each service."""
+        process = self.script('enable', 'cc-provisioning', 'cisaudit=u:p')
+        self.assertEqual(3, process.returncode)
+        self.assertFalse(self.cisaudit_repo_list.exists())
+
+    def test_enable_already_enabled(self):
+        """Nothing is enabled if a service is already enabled."""
+        self.setup_cc(enabled=True)
+        process = self.script(
+            'enable', 'cisaudit=user:pass', 'cc-provisioning=user:pass')
+        self.assertEqual(6, process.returncode)
+        self.assertFalse(self.cisaudit_repo_list.exists())
+
+    def test_enable_invalid_service(self):
+        """Service names are validated."""
+        process = self.script('enable', 'foo=user:pass')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid service: "foo"', process.stderr)
+
+    def test_enable_no_services(self):
+        """At least one service is required."""
+        process = self.script('enable')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('No service to enable', process.stderr)
+
+    def test_enable_not_root(self):
+        """The enable command must be run as root."""
+        self.make_fake_binary('id', command='echo 100')
+        process = self.script('enable', 'cisaudit=user:pass')
+        self.assertEqual(2, process.returncode)
+
+    def test_disable(self):
+        """The disable command disables several services."""
+        self.script(
+            'enable', 'cc-provisioning=user:pass', 'cisaudit=user:pass')
+        self.setup_packages(
+            ['ubuntu-commoncriteria', 'ubuntu-cisbenchmark-16.04'])
+        self.make_fake_binary('apt-get', command=APT_GET_LOG_WRAPPER)
+        process = self.script('disable', 'cc-provisioning', 'cisaudit')
+        self.assertEqual(0, process.returncode)
+        self.assertFalse(self.cc_repo_list.exists())
+        self.assertFalse(self.cisaudit_repo_list.exists())
+        self.assertIn(
+            'Canonical Common Criteria EAL2 Provisioning Disabled.',
+            process.stdout)
+        self.assertIn(
+            'Canonical CIS Benchmark 16.04 Audit Tool Removed.',
+            process.stdout)
+        self.assertNotIn(' update', self.read_file('apt_get.args'))
+
+    def test_disable_not_enabled(self):
+        """Nothing is disabled if a service is not enabled."""
+        self.script('enable-cc-provisioning', 'user:pass')
+        self.setup_packages(['ubuntu-commoncriteria'])
+        process = self.script('disable', 'cc-provisioning', 'cisaudit')
+        self.assertEqual(8, process.returncode)
+        self.assertTrue(self.cc_repo_list.exists())
@@ -1,7 +1,11 @@
 """Tests for the ubuntu-advantage script."""
 
+import fcntl
+import shutil
+from pathlib import Path
+
 from testing import UbuntuAdvantageTest
-from fakes import LIVEPATCH_UNSUPPORTED_KERNEL
+from fakes import LIVEPATCH_ENABLED, LIVEPATCH_UNSUPPORTED_KERNEL
 
 
 class UbuntuAdvantageScriptTest(UbuntuAdvantageTest):
@@ -55,6 +59,55 @@ class UbuntuAdvantageScriptTest(UbuntuAdvantageTest):
         self.assertIn("livepatch: disabled (not available)", process.stdout)
         self.assertIn("esm: enabled", process.stdout)
 
+    def test_series_from_os_release(self):
+        """The series is read from the os-release file."""
+        self.make_fake_binary('lsb_release', command='echo xenial')
+        self.os_release_file.write_text(
+            'NAME="Ubuntu"\nVERSION_CODENAME=precise\n')
+        self.setup_livepatch(installed=False, enabled=False)
+        process = self.script('status')
+        self.assertIn("livepatch: disabled (not available)", process.stdout)
+        self.assertIn("esm: disabled\n", process.stdout)
+
+    def test_series_from_lsb_release(self):
+        """If os-release has no codename, lsb-release is used."""
+        self.make_fake_binary('lsb_release', command='echo xenial')
+        self.os_release_file.write_text('NAME="Ubuntu"\nVERSION="12.04"\n')
+        self.lsb_release_file.write_text(
+            'DISTRIB_ID=Ubuntu\nDISTRIB_CODENAME=precise\n')
+        self.setup_livepatch(installed=False, enabled=False)
+        process = self.script('status')
+        self.assertIn("esm: disabled\n", process.stdout)
+
+    def test_series_from_lsb_release_command(self):
+        """If no release file has the codename, lsb_release is called."""
+        self.make_fake_binary('lsb_release', command='echo precise')
+        self.setup_livepatch(installed=False, enabled=False)
+        process = self.script('status')
+        self.assertIn("esm: disabled\n", process.stdout)
+
+    def test_series_override(self):
+        """The SERIES variable overrides the release files."""
+        self.SERIES = 'precise'
+        self.os_release_file.write_text('VERSION_CODENAME=xenial\n')
+        self.setup_livepatch(installed=False, enabled=False)
+        process = self.script('status')
+        self.assertIn("esm: disabled\n", process.stdout)
+
+    def test_service_modules_loaded_when_needed(self):
+        """Service modules are only sourced when the service is used."""
+        script_dir = Path(self.tempdir.join('script'))
+        shutil.copytree('modules', str(script_dir / 'modules'))
+        shutil.copy('ubuntu-advantage', str(script_dir))
+        (script_dir / 'modules' / 'service-fips.sh').write_text('exit 42\n')
+        self.SCRIPT = str(script_dir / 'ubuntu-advantage')
+        self.SERIES = 'precise'
+        process = self.script('is-esm-enabled')
+        self.assertEqual(1, process.returncode)
+        self.assertEqual('', process.stderr)
+        process = self.script('status', 'fips')
+        self.assertEqual(42, process.returncode)
+
     def test_livepatch_status_no_empty_line(self):
         """The status output has no empty lines when livepatch is enabled."""
         self.setup_livepatch(installed=True, enabled=True)
@@ -113,6 +166,95 @@ class UbuntuAdvantageScriptTest(UbuntuAdvantageTest):
 
     def test_version(self):
         """The version command shows the package version."""
-        self.make_fake_binary('dpkg-query', command='echo 123')
+        self.setup_packages({'ubuntu-advantage-tools': '123'})
         process = self.script('version')
         self.assertEqual(process.stdout, '123\n')
+
+    def test_status_probes_run_once(self):
+        """The status command runs each external probe only once."""
+        self.SERIES = 'xenial'
+        self.setup_fips(enabled=True)
+        self.make_fake_binary(
+            'canonical-livepatch',
+            command='echo livepatch >> {}/probes.log\n{}'.format(
+                self.tempdir.path, LIVEPATCH_ENABLED))
+        process = self.script('status')
+        self.assertEqual(0, process.returncode)
+        self.assertIn('livepatch: enabled', process.stdout)
+        self.assertIn('patchState: applied', process.stdout)
+        self.assertIn('fips-updates (uncertified): disabled', process.stdout)
+        self.assertEqual('livepatch\n', self.read_file('probes.log'))
+
+    def test_status_parallel(self):
+        """The status of services can be checked concurrently."""
+        self.SERIES = 'xenial'
+        self.setup_livepatch(installed=True, enabled=True)
+        process = self.script('status', '--parallel')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(process.stdout, self.script('status').stdout)
+        services = [
+            line.split(':')[0] for line in process.stdout.splitlines()
+            if not line.startswith(' ')]
+        self.assertEqual(
+            ['cc-provisioning', 'cisaudit', 'esm', 'fips', 'livepatch'],
+            services)
+
+    def test_status_parallel_with_one_service(self):
+        """The parallel status can be returned for a single service."""
+        self.SERIES = 'precise'
+        process = self.script('status', '--parallel', 'fips')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('fips: disabled (not available)\n', process.stdout)
+
+    def test_status_parallel_any_position(self):
+        """The --parallel option can be given after other arguments."""
+        self.SERIES = 'precise'
+        process = self.script('status', 'fips', '--parallel')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('fips: disabled (not available)\n', process.stdout)
+        process = self.script('status', '--max-age', '0', '--parallel')
+        self.assertEqual(0, process.returncode)
+        self.assertIn('fips: disabled (not available)\n', process.stdout)
+
+    def test_is_enabled_parallel_invalid(self):
+        """The --parallel option is only accepted by status."""
+        process = self.script('is-esm-enabled', '--parallel')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Unknown option "--parallel"', process.stderr)
+
+    def test_enable_waits_for_lock(self):
+        """Commands changing the system wait for other ones to finish."""
+        with self.ua_lock_file.open('w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            process = self.script(
+                'enable-esm', 'user:pass',
+                env_update={'UA_LOCK_TIMEOUT': '1'})
+        self.assertEqual(10, process.returncode)
+        self.assertIn(
+            'Waiting for another ubuntu-advantage command to finish... ERROR',
+            process.stdout)
+        self.assertIn('Timed out waiting for the lock', process.stderr)
+        self.assertFalse(self.esm_repo_list.exists())
+
+    def test_update_status_cache_lock_busy(self):
+        """update-status-cache doesn't wait for the lock."""
+        with self.ua_lock_file.open('w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            process = self.script(
+                'update-status-cache', '--changed',
+                env_update={'UA_LOCK_TIMEOUT': '600'})
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('', process.stdout)
+        self.assertFalse(self.ua_status_data.exists())
+
+    def test_enable_lock_not_passed_on(self):
+        """Commands run by the tool don't hold or wait for the lock."""
+        self.SERIES = 'precise'
+        self.make_fake_binary(
+            'apt-get',
+            command='UA_LOCK_TIMEOUT=1 {} update-status-cache; '
+            'echo $? > {}/nested.status'.format(
+                Path(self.SCRIPT).resolve(), self.tempdir.path))
+        process = self.script('enable-esm', 'user:pass')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('0\n', self.read_file('nested.status'))
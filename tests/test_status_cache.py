@@ -0,0 +1,341 @@
+"""Tests for the status cache."""
+
+import os
+import re
+
+from testing import UbuntuAdvantageTest
+
+
+class StatusCacheTest(UbuntuAdvantageTest):
+
+    SERIES = 'xenial'
+    ARCH = 'x86_64'
+
+    def setUp(self):
+        super().setUp()
+        self.setup_livepatch(installed=True, enabled=True)
+
+    def read_status_data(self):
+        """Return status data lines as a list of (key, value) tuples."""
+        lines = self.ua_status_data.read_text().splitlines()
+        return [tuple(line.split('=', 1)) for line in lines
+                if not line.startswith('#')]
+
+    def test_update_status_cache(self):
+        """update-status-cache writes the status output to the cache."""
+        process = self.script('update-status-cache')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(
+            self.script('status').stdout, self.ua_status_cache.read_text())
+        self.assertEqual(0o100644, self.ua_status_cache.stat().st_mode)
+
+    def test_update_status_cache_data(self):
+        """The status of each service is saved in key=value format."""
+        self.setup_packages(['ubuntu-cisbenchmark-16.04'])
+        self.script('update-status-cache')
+        data = self.read_status_data()
+        self.assertEqual(0o100644, self.ua_status_data.stat().st_mode)
+        self.assertIn(('cc-provisioning.status', 'disabled'), data)
+        self.assertIn(('cisaudit.status', 'enabled'), data)
+        self.assertIn(
+            ('cisaudit.detail', 'cisaudit: files are in /usr/share/'
+             'ubuntu-securityguides/ubuntu-cisbenchmark-16.04'), data)
+        self.assertIn(('esm.status', 'disabled (not available)'), data)
+        self.assertIn(('livepatch.status', 'enabled'), data)
+        self.assertIn(('livepatch.detail', '    patchState: applied'), data)
+
+    def test_update_status_cache_metadata(self):
+        """The generation time and inputs mtimes are saved."""
+        self.setup_packages(['foo'])
+        self.script('update-status-cache')
+        data = dict(self.read_status_data())
+        self.assertGreater(int(data['generated']), 0)
+        self.assertEqual(
+            str(int(self.dpkg_status_file.stat().st_mtime)),
+            data['input.dpkg'])
+        # the sources.list file doesn't exist
+        self.assertEqual(
+            '0,{}'.format(int(self.apt_sources_dir.stat().st_mtime)),
+            data['input.apt-sources'])
+        self.assertEqual(
+            str(int(self.apt_lists_dir.stat().st_mtime)),
+            data['input.apt-lists'])
+
+    def test_update_status_cache_replaces_files(self):
+        """Cache files are replaced, not written in place."""
+        self.ua_status_cache.write_text('old status')
+        self.ua_status_data.write_text('old data')
+        inode = self.ua_status_data.stat().st_ino
+        self.script('update-status-cache')
+        self.assertNotEqual(inode, self.ua_status_data.stat().st_ino)
+        self.assertNotIn('old', self.ua_status_data.read_text())
+        self.assertNotIn('old', self.ua_status_cache.read_text())
+        # no temporary files are left behind
+        self.assertEqual(
+            [], list(self.ua_status_data.parent.glob('ua-status-*.*')))
+
+    def test_update_status_cache_needs_root(self):
+        """update-status-cache must be run as root."""
+        self.make_fake_binary('id', command='echo 100')
+        process = self.script('update-status-cache')
+        self.assertEqual(2, process.returncode)
+        self.assertFalse(self.ua_status_data.exists())
+
+    def test_status_cached(self):
+        """status --cached uses the cached status."""
+        self.script('update-status-cache')
+        # the status changed, but the cache is used
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('status', '--cached')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(self.ua_status_cache.read_text(), process.stdout)
+        self.assertIn('livepatch: enabled\n', process.stdout)
+        self.assertIn('  client-version: "7.23"\n', process.stdout)
+
+    def test_status_cached_one_service(self):
+        """status --cached can show a single service."""
+        self.script('update-status-cache')
+        process = self.script('status', '--cached', 'esm')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('esm: disabled (not available)\n', process.stdout)
+
+    def test_status_max_age(self):
+        """The cache is used if it's not older than the max age."""
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('status', '--max-age', '3600')
+        self.assertIn('livepatch: enabled\n', process.stdout)
+
+    def test_status_max_age_too_old(self):
+        """The cache is refreshed if older than the max age."""
+        self.script('update-status-cache')
+        data = self.ua_status_data.read_text()
+        self.ua_status_data.write_text(
+            re.sub('generated=[0-9]+', 'generated=1000', data))
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('status', '--max-age', '60')
+        self.assertIn('livepatch: disabled\n', process.stdout)
+        # the cache is updated
+        self.assertIn(
+            'livepatch: disabled\n', self.ua_status_cache.read_text())
+        self.assertNotIn('generated=1000\n', self.ua_status_data.read_text())
+
+    def test_update_status_cache_checked_time(self):
+        """The time each service was checked is kept by partial refreshes."""
+        self.script('update-status-cache')
+        data = self.ua_status_data.read_text()
+        self.ua_status_data.write_text(
+            re.sub('(generated|checked)=[0-9]+', '\\1=1000', data))
+        self.script('update-status-cache', 'esm')
+        data = dict(self.read_status_data())
+        self.assertNotEqual('1000', data['generated'])
+        self.assertNotEqual('1000', data['esm.checked'])
+        self.assertEqual('1000', data['livepatch.checked'])
+
+    def test_status_max_age_partial_refresh(self):
+        """The cache is refreshed if a service was checked too long ago."""
+        self.script('update-status-cache')
+        data = self.ua_status_data.read_text()
+        self.ua_status_data.write_text(
+            re.sub('(generated|checked)=[0-9]+', '\\1=1000', data))
+        self.script('update-status-cache', 'esm')
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('status', '--max-age', '60')
+        self.assertIn('livepatch: disabled\n', process.stdout)
+
+    def test_is_enabled_max_age_refreshes_service(self):
+        """Only the requested service is checked if the cache is too old."""
+        self.script('update-status-cache')
+        data = self.ua_status_data.read_text()
+        self.ua_status_data.write_text(
+            re.sub('(generated|checked)=[0-9]+', '\\1=1000', data))
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('is-livepatch-enabled', '--max-age', '60')
+        self.assertEqual(1, process.returncode)
+        data = dict(self.read_status_data())
+        self.assertNotEqual('1000', data['livepatch.checked'])
+        self.assertEqual('1000', data['esm.checked'])
+
+    def test_status_cached_inputs_changed(self):
+        """The cache is refreshed if inputs changed."""
+        self.script('update-status-cache')
+        # installing a package changes the status
+        self.setup_packages(['ubuntu-commoncriteria'])
+        process = self.script('status', '--cached')
+        self.assertIn('cc-provisioning: enabled\n', process.stdout)
+        self.assertIn(
+            'cc-provisioning.status=enabled',
+            self.ua_status_data.read_text())
+
+    def test_status_cached_no_cache_not_writable(self):
+        """Without a writable cache, the status is checked directly."""
+        process = self.script(
+            'status', '--cached',
+            env_update={'UA_STATUS_DATA': '/nonexistent/ua-status-data'})
+        self.assertEqual(0, process.returncode)
+        self.assertIn('livepatch: enabled\n', process.stdout)
+
+    def test_status_max_age_invalid(self):
+        """The max age must be a number of seconds."""
+        process = self.script('status', '--max-age', 'foo')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid maximum age "foo"', process.stderr)
+
+    def test_status_max_age_missing(self):
+        """The max age must be specified."""
+        process = self.script('status', '--max-age')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid maximum age ""', process.stderr)
+        process = self.script('status', '--max-age=')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid maximum age ""', process.stderr)
+
+    def test_is_enabled_max_age_invalid(self):
+        """is-<service>-enabled also rejects an invalid or missing max age."""
+        process = self.script('is-esm-enabled', '--max-age', 'foo')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid maximum age "foo"', process.stderr)
+        process = self.script('is-esm-enabled', '--max-age')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('Invalid maximum age ""', process.stderr)
+
+    def test_is_enabled_cached(self):
+        """is-<service>-enabled can use the cached status."""
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('is-livepatch-enabled', '--cached')
+        self.assertEqual(0, process.returncode)
+        process = self.script('is-livepatch-enabled')
+        self.assertEqual(1, process.returncode)
+        process = self.script('is-esm-enabled', '--max-age', '3600')
+        self.assertEqual(1, process.returncode)
+
+    def test_status_timeout_stale(self):
+        """If a probe times out, the cached status is shown as stale."""
+        self.script('update-status-cache')
+        self.make_fake_binary('canonical-livepatch', command='sleep 10')
+        process = self.script(
+            'status', 'livepatch', env_update={'UA_PROBE_TIMEOUT': '1'})
+        self.assertEqual(0, process.returncode)
+        self.assertIn('livepatch: enabled (stale)\n', process.stdout)
+        self.assertIn('  client-version: "7.23"\n', process.stdout)
+
+    def test_status_timeout_no_cache(self):
+        """If a probe times out without a cache, the status is unknown."""
+        self.make_fake_binary('canonical-livepatch', command='sleep 10')
+        process = self.script(
+            'status', 'livepatch', env_update={'UA_PROBE_TIMEOUT': '1'})
+        self.assertEqual(0, process.returncode)
+        self.assertEqual(
+            'livepatch: unknown (status check timed out)\n', process.stdout)
+
+    def test_update_status_cache_timeout_stale(self):
+        """A stale status is flagged in the cache, and checked again."""
+        self.script('update-status-cache')
+        self.make_fake_binary('canonical-livepatch', command='sleep 10')
+        self.script(
+            'update-status-cache', env_update={'UA_PROBE_TIMEOUT': '1'})
+        data = self.read_status_data()
+        self.assertIn(('livepatch.status', 'enabled'), data)
+        self.assertIn(('livepatch.stale', 'yes'), data)
+        # the text cache, read by MOTD scripts, has no stale flag
+        self.assertIn('livepatch: enabled\n', self.ua_status_cache.read_text())
+        self.setup_livepatch(installed=True, enabled=False)
+        process = self.script('status', '--cached')
+        self.assertIn('livepatch: disabled\n', process.stdout)
+        self.assertNotIn(
+            'livepatch.stale', self.ua_status_data.read_text())
+
+    def test_is_enabled_timeout_cached(self):
+        """If a probe times out, is-<service>-enabled uses the cache."""
+        self.script('update-status-cache')
+        self.make_fake_binary('canonical-livepatch', command='sleep 10')
+        process = self.script(
+            'is-livepatch-enabled', env_update={'UA_PROBE_TIMEOUT': '1'})
+        self.assertEqual(0, process.returncode)
+
+    def test_update_status_cache_changed(self):
+        """With --changed, only services whose inputs changed are checked."""
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        self.setup_packages(['ubuntu-commoncriteria'])
+        process = self.script('update-status-cache', '--changed')
+        self.assertEqual(0, process.returncode)
+        status = self.ua_status_cache.read_text()
+        # services depending on packages are checked again
+        self.assertIn('cc-provisioning: enabled\n', status)
+        # livepatch is not
+        self.assertIn('livepatch: enabled\n', status)
+        self.assertIn('  client-version: "7.23"\n', status)
+        data = self.ua_status_data.read_text()
+        self.assertIn('cc-provisioning.status=enabled\n', data)
+        self.assertIn('livepatch.status=enabled\n', data)
+
+    def test_update_status_cache_changed_repo_list(self):
+        """Changes to a service repository list file are detected."""
+        self.esm_repo_list.write_text('')
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        # the file is changed in place, so the directory mtime doesn't change
+        sources_mtime = self.apt_sources_dir.stat().st_mtime
+        self.setup_esm(enabled=True)
+        os.utime(str(self.esm_repo_list), (0, sources_mtime + 10))
+        os.utime(str(self.apt_sources_dir), (0, sources_mtime))
+        self.script('update-status-cache', '--changed')
+        status = self.ua_status_cache.read_text()
+        self.assertIn('esm: enabled\n', status)
+        self.assertIn('livepatch: enabled\n', status)
+
+    def test_update_status_cache_changed_livepatch_state(self):
+        """Livepatch status is checked again if the daemon state changed."""
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        (self.livepatch_state_dir / 'state').mkdir(parents=True)
+        self.script('update-status-cache', '--changed')
+        self.assertIn(
+            'livepatch: disabled\n', self.ua_status_cache.read_text())
+
+    def test_update_status_cache_changed_fips_enabled(self):
+        """FIPS status is checked again if the kernel FIPS mode changed."""
+        self.setup_fips(enabled=False)
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        self.assertIn('fips: disabled', self.ua_status_cache.read_text())
+        self.fips_enabled_file.write_text('1')
+        os.utime(str(self.fips_enabled_file), (0, 0))
+        self.script('update-status-cache', '--changed')
+        status = self.ua_status_cache.read_text()
+        self.assertIn('fips: enabled\n', status)
+        self.assertIn('livepatch: enabled\n', status)
+
+    def test_update_status_cache_service(self):
+        """The status can be updated for named services."""
+        self.script('update-status-cache')
+        self.setup_livepatch(installed=True, enabled=False)
+        self.script('update-status-cache', 'livepatch')
+        self.assertIn(
+            'livepatch: disabled\n', self.ua_status_cache.read_text())
+
+    def test_update_status_cache_changed_no_cache(self):
+        """Without a cache, the status of all services is checked."""
+        self.script('update-status-cache', '--changed')
+        self.assertEqual(
+            self.script('status').stdout, self.ua_status_cache.read_text())
+
+    def test_disable_refreshes_cache(self):
+        """Disabling a service refreshes its cached status."""
+        self.setup_packages(['ubuntu-cisbenchmark-16.04'])
+        self.script('update-status-cache')
+        self.assertIn('cisaudit: enabled\n', self.ua_status_cache.read_text())
+        self.setup_livepatch(installed=True, enabled=False)
+        # removing the package changes the dpkg status
+        self.make_fake_binary(
+            'apt-get',
+            command='case "$*" in *remove*) : > {};; esac'.format(
+                self.dpkg_status_file))
+        process = self.script('disable-cisaudit')
+        self.assertEqual(0, process.returncode)
+        status = self.ua_status_cache.read_text()
+        self.assertIn('cisaudit: disabled\n', status)
+        # other services are not checked
+        self.assertIn('livepatch: enabled\n', status)
@@ -16,8 +16,7 @@ from fakes import (
     SNAP_LIVEPATCH_NOT_INSTALLED,
     LIVEPATCH_ENABLED,
     LIVEPATCH_DISABLED,
-    ESM_ENABLED,
-    ESM_DISABLED,
+    FIPS_PACKAGES,
 )
 
 ProcessResult = namedtuple('ProcessResult', ['returncode', 'stdout', 'stderr'])
@@ -53,33 +52,50 @@ class UbuntuAdvantageTest(TestWithFixtures):
         self.boot_cfg = Path(self.tempdir.join('boot.cfg'))
         self.fstab = Path(self.tempdir.join('fstab'))
         self.cpuinfo = Path(self.tempdir.join('cpuinfo'))
-        self.esm_repo_list = Path(self.tempdir.join('esm-repo.list'))
-        self.fips_repo_list = Path(self.tempdir.join('fips-repo.list'))
-        self.fips_updates_repo_list = Path(
-            self.tempdir.join('fips-updates-repo.list'))
-        self.cc_repo_list = Path(self.tempdir.join('cc-repo.list'))
-        self.cisaudit_repo_list = Path(self.tempdir.join('cisaudit-repo.list'))
+        self.apt_sources_list = Path(self.tempdir.join('sources.list'))
+        self.apt_sources_dir = Path(self.tempdir.join('sources.list.d'))
+        self.apt_lists_dir = Path(self.tempdir.join('lists'))
+        self.esm_repo_list = self.apt_sources_dir / 'esm-repo.list'
+        self.fips_repo_list = self.apt_sources_dir / 'fips-repo.list'
+        self.fips_updates_repo_list = (
+            self.apt_sources_dir / 'fips-updates-repo.list')
+        self.cc_repo_list = self.apt_sources_dir / 'cc-repo.list'
+        self.cisaudit_repo_list = self.apt_sources_dir / 'cisaudit-repo.list'
         self.fips_repo_preferences = Path(
             self.tempdir.join('preferences-fips'))
         self.fips_updates_repo_preferences = Path(
             self.tempdir.join('preferences-fips-updates'))
         self.fips_enabled_file = Path(self.tempdir.join('fips_enabled_file'))
+        self.dpkg_status_file = Path(self.tempdir.join('dpkg-status'))
+        self.livepatch_state_dir = Path(self.tempdir.join('livepatch'))
         self.bin_dir = Path(self.tempdir.join('bin'))
         self.etc_dir = Path(self.tempdir.join('etc'))
+        self.lsb_release_file = self.etc_dir / 'lsb-release'
+        self.os_release_file = self.etc_dir / 'os-release'
         self.keyrings_dir = Path(self.tempdir.join('keyrings'))
         self.trusted_gpg_dir = Path(self.tempdir.join('trusted.gpg.d'))
         self.apt_auth_file = Path(self.tempdir.join('auth.conf'))
+        # not created by default, as with apt versions not supporting it
+        self.apt_auth_dir = Path(self.tempdir.join('auth.conf.d'))
         self.apt_method_https = self.bin_dir / 'apt-method-https'
         self.ca_certificates = self.bin_dir / 'update-ca-certificates'
         self.snapd = self.bin_dir / 'snapd'
         self.apt_helper = self.bin_dir / 'apt-helper'
         self.ua_status_cache = Path(self.tempdir.join('ua-status-cache'))
+        self.ua_status_data = Path(self.tempdir.join('ua-status-data'))
+        self.ua_apt_update_data = Path(self.tempdir.join('apt-update.dat'))
+        self.ua_token_cache_dir = Path(self.tempdir.join('tokens'))
+        self.ua_lock_file = Path(self.tempdir.join('ua.lock'))
+        self.apt_update_success_stamp = Path(
+            self.tempdir.join('update-success-stamp'))
         # setup directories and files
         self.bin_dir.mkdir()
         self.keyrings_dir.mkdir()
         self.etc_dir.mkdir()
         self.fstab.write_text('')
         self.trusted_gpg_dir.mkdir()
+        self.apt_sources_dir.mkdir()
+        self.apt_lists_dir.mkdir()
         (self.keyrings_dir / 'ubuntu-esm-keyring.gpg').write_text('GPG key')
         (self.keyrings_dir / 'ubuntu-fips-keyring.gpg').write_text('GPG key')
         (self.keyrings_dir / 'ubuntu-fips-updates-keyring.gpg').write_text(
@@ -91,6 +107,7 @@ class UbuntuAdvantageTest(TestWithFixtures):
         self.make_fake_binary('apt-get')
         self.make_fake_binary('apt-helper')
         self.make_fake_binary('apt-method-https')
+        self.make_fake_binary('gpgv')
         self.make_fake_binary('update-ca-certificates')
         self.make_fake_binary('id', command='echo 0')
         self.make_fake_binary('snapd')
@@ -116,9 +133,18 @@ class UbuntuAdvantageTest(TestWithFixtures):
         env = {
             'UA': './ubuntu-advantage',
             'UA_STATUS_CACHE': str(self.ua_status_cache),
+            'UA_STATUS_DATA': str(self.ua_status_data),
+            'UA_APT_UPDATE_DATA': str(self.ua_apt_update_data),
+            'UA_TOKEN_CACHE_DIR': str(self.ua_token_cache_dir),
+            'UA_LOCK_FILE': str(self.ua_lock_file),
+            'UA_FETCH_RETRY_DELAY': '0',
+            'APT_UPDATE_SUCCESS_STAMP': str(self.apt_update_success_stamp),
             'PATH': path,
             'FSTAB': str(self.fstab),
             'CPUINFO': str(self.cpuinfo),
+            'LSB_RELEASE_FILE': str(self.lsb_release_file),
+            'OS_RELEASE_FILE': str(self.os_release_file),
+            'DPKG_STATUS_FILE': str(self.dpkg_status_file),
             'ESM_REPO_LIST': str(self.esm_repo_list),
             'FIPS_REPO_LIST': str(self.fips_repo_list),
             'FIPS_UPDATES_REPO_LIST': str(self.fips_updates_repo_list),
@@ -130,9 +156,15 @@ class UbuntuAdvantageTest(TestWithFixtures):
             'FIPS_REPO_PREFERENCES': str(self.fips_repo_preferences),
             'FIPS_UPDATES_REPO_PREFERENCES': str(
                 self.fips_updates_repo_preferences),
+            'LIVEPATCH_SNAP_DIR': str(self.livepatch_state_dir / 'snap'),
+            'LIVEPATCH_STATE_DIR': str(self.livepatch_state_dir / 'state'),
             'KEYRINGS_DIR': str(self.keyrings_dir),
             'APT_HELPER': str(self.apt_helper),
             'APT_AUTH_FILE': str(self.apt_auth_file),
+            'APT_AUTH_DIR': str(self.apt_auth_dir),
+            'APT_SOURCES_LIST': str(self.apt_sources_list),
+            'APT_SOURCES_DIR': str(self.apt_sources_dir),
+            'APT_LISTS_DIR': str(self.apt_lists_dir),
             'APT_KEYS_DIR': str(self.trusted_gpg_dir),
             'APT_METHOD_HTTPS': str(self.apt_method_https),
             'CA_CERTIFICATES': str(self.ca_certificates),
@@ -156,6 +188,19 @@ class UbuntuAdvantageTest(TestWithFixtures):
         process.stderr.close()
         return result
 
+    def setup_packages(self, packages):
+        """Setup the dpkg status for installed packages.
+
+        The packages can be either a list of names or a dict mapping names
+        to versions.
+        """
+        if not isinstance(packages, dict):
+            packages = {package: '1.0' for package in packages}
+        self.dpkg_status_file.write_text(''.join(
+            'Package: {}\nStatus: install ok installed\nVersion: {}\n\n'
+            .format(package, version)
+            for package, version in packages.items()))
+
     def setup_livepatch(self, installed=False, enabled=None,
                         livepatch_command=None):
         """Setup livepatch-related fakes."""
@@ -170,32 +215,34 @@ class UbuntuAdvantageTest(TestWithFixtures):
                 command = LIVEPATCH_ENABLED if enabled else LIVEPATCH_DISABLED
             self.make_fake_binary('canonical-livepatch', command=command)
 
+    def setup_apt_source(self, list_file, repo_url, series, fetched=True):
+        """Add an apt source, optionally with fetched indexes."""
+        list_file.write_text(
+            'deb {}/ubuntu {} main\n'.format(repo_url, series))
+        if fetched:
+            lists_prefix = '{}/ubuntu/dists/{}'.format(
+                repo_url.split('://')[1], series).replace('/', '_')
+            (self.apt_lists_dir / (lists_prefix + '_InRelease')).write_text(
+                '')
+
     def setup_esm(self, enabled=False):
         """Setup the ESM repository."""
-        command = ESM_ENABLED if enabled else ESM_DISABLED
-        self.make_fake_binary('apt-cache', command=command)
+        if enabled:
+            self.setup_apt_source(
+                self.esm_repo_list, 'https://esm.ubuntu.com', 'precise')
 
     def setup_fips(self, enabled=None):
         """Setup FIPS."""
         if enabled is None:
             return
-        self.make_fake_binary('dpkg-query')
+        self.setup_packages(FIPS_PACKAGES)
         self.fips_enabled_file.write_text('1' if enabled else '0')
 
     def setup_cc(self, enabled=False):
         """Setup the CC repository."""
-        if enabled is True:
-            self.make_fake_binary(
-                'dpkg-query', command='[ $2 = ubuntu-commoncriteria ]')
-        else:
-            self.make_fake_binary(
-                'dpkg-query', command='[ $2 != ubuntu-commoncriteria ]')
+        self.setup_packages(['ubuntu-commoncriteria'] if enabled else [])
 
     def setup_cisaudit(self, enabled=False):
         """Setup the CISAudit repository."""
-        if enabled is True:
-            self.make_fake_binary(
-                'dpkg-query', command='[ $2 = ubuntu-cisbenchmark-16.04 ]')
-        else:
-            self.make_fake_binary(
-                'dpkg-query', command='[ $2 != ubuntu-cisbenchmark-16.04 ]')
+        self.setup_packages(
+            ['ubuntu-cisbenchmark-16.04'] if enabled else [])